@@ -0,0 +1,72 @@
+"""
+Per-tick cost of reading the MumbleLink, structures mapped onto the shared memory (zero copy)
+against copying them out through Unpack on every read
+
+Time with timeit, allocations with tracemalloc, for ticks with a new frame and idle ticks
+where uiTick did not change. Runs on a file-backed link outside of Windows
+    python Tools/benchmarks/bench_mumble.py
+"""
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import gw2rpc.mumble  # noqa: E402
+from gw2rpc.headless import MumbleLinkWriter  # noqa: E402
+from gw2rpc.mumble import MumbleData  # noqa: E402
+
+TICKS = 20000
+
+FRAME = {
+    "identity": {"name": "Some Char", "profession": 4, "spec": 0, "race": 2, "map_id": 1452,
+                 "world_id": 2004, "team_color_id": 0, "commander": True, "fov": 0.9, "uisz": 1},
+    "position": [-120.5, 30.25, 512.0],
+    "build_id": 150000
+}
+
+
+def measure(tick):
+    """
+    Returns seconds per tick and the peak memory allocated while running 1000 ticks
+    """
+    seconds = timeit.timeit(tick, number=TICKS) / TICKS
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for _ in range(1000):
+        tick()
+    peak = tracemalloc.get_traced_memory()[1] - start
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def bench(writer, zero_copy):
+    game = MumbleData("BenchLink", zero_copy=zero_copy)
+    game.create_map()
+
+    def new_frame():
+        writer.link.link.uiTick += 1
+        game.get_mumble_data()
+        game.get_position()
+
+    def idle():
+        game.get_mumble_data()
+        game.get_position()
+
+    name = "zero copy" if zero_copy else "Unpack"
+    for kind, tick in (("new frame", new_frame), ("idle", idle)):
+        seconds, peak = measure(tick)
+        print(f"{name:>9}, {kind:>9}: {seconds * 1e6:6.1f} us per tick, peak {peak / 1024:6.1f} KiB allocated")
+    game.close_map()
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        gw2rpc.mumble.LINK_DIR = directory
+        writer = MumbleLinkWriter("BenchLink")
+        writer.write(FRAME)
+        for zero_copy in (False, True):
+            bench(writer, zero_copy)
+        writer.close()
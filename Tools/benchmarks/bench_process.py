@@ -0,0 +1,88 @@
+"""
+Per-tick cost of finding Gw2 processes, the full process_iter walks the loop used to do
+against ProcessWatcher.refresh
+
+Against a fake table of 500 and 2000 processes, counting the per-process calls, which are
+system calls with psutil, then against the real process table of this machine
+    python Tools/benchmarks/bench_process.py
+"""
+import os
+import sys
+import timeit
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from gw2rpc.process import GW2_NAMES, RPC_NAME, ProcessWatcher  # noqa: E402
+
+TICKS = 50
+
+
+class FakeProcess:
+    calls = 0
+
+    def __init__(self, pid, name):
+        self.pid = pid
+        self._name = name
+
+    def name(self):
+        FakeProcess.calls += 1
+        return self._name
+
+    def cmdline(self):
+        FakeProcess.calls += 1
+        return [self._name]
+
+    def is_running(self):
+        FakeProcess.calls += 1
+        return True
+
+
+def full_scan(processes):
+    """
+    What every tick did before ProcessWatcher: name and cmdline of everything for the mumble links,
+    then two more walks over all names for the game and other gw2rpc instances
+    """
+    links = [(p.cmdline(), p) for p in processes if p.name().lower() in GW2_NAMES]
+    game = next((p for p in processes if p.name().lower() in GW2_NAMES), None)
+    rpcs = sum(1 for p in processes if p.name().lower() == RPC_NAME)
+    return links, game, rpcs
+
+
+def fake(size):
+    table = {pid: FakeProcess(pid, "other.exe") for pid in range(size)}
+    table[size] = FakeProcess(size, "Gw2-64.exe")
+    processes = list(table.values())
+    watcher = ProcessWatcher(pids=lambda: list(table), process_factory=table.__getitem__)
+    watcher.refresh()
+    for name, tick in (("full scan", lambda: full_scan(processes)), ("ProcessWatcher", watcher.refresh)):
+        FakeProcess.calls = 0
+        seconds = timeit.timeit(tick, number=TICKS) / TICKS
+        print(f"  {name:>14}: {seconds * 1000:7.3f} ms, {FakeProcess.calls // TICKS} process calls per tick")
+
+
+def real():
+    def full_scan_real():
+        for process in psutil.process_iter():
+            try:
+                process.as_dict(attrs=['pid', 'name', 'cmdline'])
+            except psutil.NoSuchProcess:
+                pass
+        for _ in range(2):
+            for process in psutil.process_iter(attrs=['name']):
+                process.info['name']
+
+    watcher = ProcessWatcher()
+    watcher.refresh()
+    for name, tick in (("full scan", full_scan_real), ("ProcessWatcher", watcher.refresh)):
+        seconds = timeit.timeit(tick, number=TICKS) / TICKS
+        print(f"  {name:>14}: {seconds * 1000:7.3f} ms")
+
+
+if __name__ == "__main__":
+    for size in (500, 2000):
+        print(f"Fake table, {size} processes:")
+        fake(size)
+    print(f"This machine, {len(psutil.pids())} processes:")
+    real()
@@ -0,0 +1,66 @@
+"""
+Per-tick cost of the registry lookups in get_activity and get_map_asset, on the raw registry
+JSON as they used to be done against the compiled Registry tables
+The registry is generated with about the size of the one served by gw2rpc.info
+    python Tools/benchmarks/bench_registry.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from gw2rpc.registry import Registry  # noqa: E402
+
+TICKS = 100000
+
+
+def registry_json():
+    return {
+        "special": {**{f"Special Map {i}": f"special_{i}" for i in range(50)},
+                    **{str(2000 + i): "strike" for i in range(50)}},
+        "valid": list(range(15, 1500, 4)),
+        "regions": {str(i): f"region_{i}" for i in range(1, 40)},
+        "fractals": [{"id": 1000 + i, "name": f"Fractal {i}"} for i in range(30)],
+        "raids": {str(1100 + i): [{"name": f"Boss {i}", "coord": [0, 0]}] for i in range(20)},
+        "mounts": {str(i): f"Mount {i}" for i in range(1, 11)}
+    }
+
+
+def json_tick(registry, map_id, map_name, region, mount_index):
+    raid = str(map_id) in registry.get("raids", {})
+    fractal = map_id in [f["id"] for f in registry["fractals"]]
+    if map_name in registry["special"]:
+        image = registry["special"][map_name]
+    elif str(map_id) in registry["special"]:
+        image = registry["special"][str(map_id)]
+    elif map_id in registry["valid"]:
+        image = map_id
+    elif region in registry["regions"]:
+        image = registry["regions"][region]
+    else:
+        image = "default"
+    mount = registry["mounts"][str(mount_index)] if str(mount_index) in registry["mounts"].keys() else None
+    return raid, fractal, image, mount
+
+
+def table_tick(registry, map_id, map_name, region, mount_index):
+    raid = map_id in registry.raids
+    fractal = map_id in registry.fractals
+    image = registry.get_image(map_id, map_name, region)
+    mount = registry.mounts.get(mount_index)
+    return raid, fractal, image, mount
+
+
+if __name__ == "__main__":
+    data = registry_json()
+    registry = Registry(data)
+    # Open world maps fall through the whole image chain to the region
+    for name, map_id, region in (("open world", 1498, "4"), ("valid map", 15, "4"), ("fractal", 1020, "26")):
+        args = (map_id, f"Map {map_id}", region, 3)
+        assert json_tick(data, *args) == table_tick(registry, *args)
+        old = timeit.timeit(lambda: json_tick(data, *args), number=TICKS) / TICKS
+        new = timeit.timeit(lambda: table_tick(registry, *args), number=TICKS) / TICKS
+        print(f"{name:>10}: registry JSON {old * 1e6:5.2f} us, Registry {new * 1e6:5.2f} us per tick")
+    build = timeit.timeit(lambda: Registry(data), number=100) / 100
+    print(f"Registry compiled once in {build * 1000:.2f} ms")
@@ -0,0 +1,53 @@
+"""
+Per-tick cost of finding the closest point of interest, the linear scan find_closest_point used
+to do against PointIndex, for a typical map and continent-sized sets of points
+    python Tools/benchmarks/bench_spatial.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from gw2rpc.spatial import PointIndex  # noqa: E402
+
+QUERIES = 2000
+
+
+def linear_nearest(points_of_interest, x, y):
+    lowest_distance = float("inf")
+    point = None
+    for item in points_of_interest.values():
+        if "name" not in item:
+            continue
+        distance = (item["coord"][0] - x)**2 + (item["coord"][1] - y)**2
+        if distance < lowest_distance:
+            lowest_distance = distance
+            point = item
+    return point
+
+
+def random_pois(n, rnd):
+    pois = {}
+    for i in range(n):
+        poi = {"id": i, "coord": [rnd.uniform(0, 81920), rnd.uniform(0, 114688)]}
+        # Unnamed points like unexplored vistas are skipped
+        if i % 10:
+            poi["name"] = f"Point {i}"
+        pois[str(i)] = poi
+    return pois
+
+
+if __name__ == "__main__":
+    rnd = random.Random(1)
+    queries = [(rnd.uniform(0, 81920), rnd.uniform(0, 114688)) for _ in range(QUERIES)]
+    for size in (100, 1000, 6000):
+        pois = random_pois(size, rnd)
+        build = timeit.timeit(lambda: PointIndex(pois), number=10) / 10
+        index = PointIndex(pois)
+        scan = timeit.timeit(lambda: [linear_nearest(pois, x, y) for x, y in queries], number=1)
+        tree = timeit.timeit(lambda: [index.nearest(x, y) for x, y in queries], number=1)
+        print(f"{size} points, {QUERIES} queries: linear scan {scan:.3f}s, PointIndex {tree:.3f}s "
+              f"({scan / QUERIES * 1e6:.0f} -> {tree / QUERIES * 1e6:.1f} us per tick), "
+              f"built once in {build * 1000:.1f} ms")
@@ -1,11 +1,94 @@
 import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from .cache import ApiCache, CharacterIndex, NegativeCache
+from .metrics import ApiMetrics
+from .ratelimit import CircuitBreaker, TokenBucket, backoff, retry_after
 from .settings import config
 
 log = logging.getLogger()
 
+BASE_URL = "https://api.guildwars2.com/v2/"
+# Endpoint families whose failures are remembered for a while instead of being retried every tick
+NEGATIVE_CACHED = ("maps/", "continents/", "characters/")
+# Endpoint families refreshed periodically, only their bodies are kept for conditional requests.
+# Maps and continents are persisted by ApiCache already, bulk responses would pin megabytes
+VALIDATED = ("characters/", "guild/")
+
+
+def continent_endpoint(map_info):
+    return ("continents/{continent_id}/floors/{default_floor}/regi"
+            "ons/{region_id}/maps/{id}".format(**map_info))
+
+
+def cache_key(endpoint):
+    return endpoint + "?lang=" + config.lang
+
+
+def create_session():
+    session = requests.Session()
+    # Room for the enricher, prefetch and key verification threads to keep their connections alive
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=16, pool_block=False)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def pool_stats(session):
+    """
+    Returns (hits, misses) of the session connection pools
+    A miss opened a new connection, every other request reused a kept alive one
+    """
+    requests_made = connections = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools[pool_key]
+            requests_made += pool.num_requests
+            connections += pool.num_connections
+    return requests_made - connections, connections
+
+
+class SingleFlight:
+    """
+    Lets concurrent callers with the same key share a single call and its result or error
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                # [done, result, error]
+                call = self._calls[key] = [threading.Event(), None, None]
+            else:
+                self.shared += 1
+        if not leader:
+            call[0].wait()
+            if call[2]:
+                raise call[2]
+            return call[1]
+        try:
+            call[1] = fn(*args, **kwargs)
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+        return call[1]
+
 
 class APIError(Exception):
     def __init__(self, code):
@@ -13,7 +96,43 @@ class APIError(Exception):
 
 
 class GW2Api:
-    def __init__(self, key=None):
+    # Shared by all clients, the official API limits requests per IP, not per key
+    limiter = TokenBucket(rate=5, capacity=50)
+    breaker = CircuitBreaker()
+    retries = 2
+    # One connection pool for all keys, the auth header is set per request
+    session = create_session()
+    flights = SingleFlight()
+    metrics = ApiMetrics()
+    failures = NegativeCache()
+    timeout = 10
+    max_validators = 256
+    max_validator_bytes = 4 * 1024 * 1024
+
+    def __init__(self, key=None, cache=None, base_url=BASE_URL, verify=True, guild_cache=None):
+        self._base_url = base_url
+        self.__headers = {
+            'User-Agent': "GW2RPC - Discord Rich Presence addon",
+            'Accept': 'application/json'
+        }
+        self._key = key
+        self._authenticated = False
+        self.cache = cache
+        self.account, self.world = None, None
+
+        self.guild_cache = guild_cache
+        # url -> (conditional request headers, last body, its size in bytes), least recently used first
+        self._validators = OrderedDict()
+        self._validator_lock = threading.Lock()
+        self._validator_bytes = 0
+        self.bytes_saved = 0
+        if key and verify:
+            self.verify()
+
+    def verify(self):
+        """
+        Checks the key permissions and looks up account and world, returns whether the key is usable
+        """
         def check_key(key):
             try:
                 res = self._call_api("tokeninfo", key=key)
@@ -37,73 +156,240 @@ class GW2Api:
             except (APIError, KeyError):
                 return None, None
 
-        self.__session = requests.Session()
-        self._base_url = "https://api.guildwars2.com/v2/"
-        self.__headers = {
-            'User-Agent': "GW2RPC - Discord Rich Presence addon",
-            'Accept': 'application/json'
-        }
-        self._authenticated = False
-        if key:
-            if check_key(key):
-                self.__headers.update(Authorization="Bearer " + key)
-                self._authenticated = True
-        self.__session.headers.update(self.__headers)
-        if self._authenticated:
+        if check_key(self._key):
+            self.__headers.update(Authorization="Bearer " + self._key)
             self.account, self.world = get_account_and_world()
-        else:
-            self.account, self.world = None, None
+            self._authenticated = True
+        return self._authenticated
 
-        self.guild_cache = {}
+    @classmethod
+    def pool_stats(cls):
+        return pool_stats(cls.session)
 
     def get_map_info(self, map_id):
-        return self._call_api("maps/" + str(map_id))
+        return self._call_cached("maps/" + str(map_id))
 
     def get_continent_info(self, map_info):
-        ep = ("continents/{continent_id}/floors/{default_floor}/regi"
-              "ons/{region_id}/maps/{id}".format(**map_info))
-        return self._call_api(ep)
+        return self._call_cached(continent_endpoint(map_info))
+
+    def get_all_maps(self):
+        return self._call_api("maps?ids=all")
+
+    def get_floor(self, continent_id, floor):
+        return self._call_api("continents/{}/floors/{}".format(continent_id, floor))
 
     def get_character(self, name):
         if not self._authenticated:
             return None
         return self._call_api("characters/" + name)
 
+    def get_character_names(self):
+        return self._call_api("characters")
+
     def get_guild(self, gid):
-        if gid in self.guild_cache.keys():
-            return {'tag': self.guild_cache[gid], 'id': gid}
-        g = self._call_api("guild/" + gid)
-        self.guild_cache[g["id"]] = g["tag"]
+        if self.guild_cache is None:
+            return self._call_api("guild/" + gid)
+        g = self.guild_cache.get("guild/" + gid)
+        if g is None:
+            g = self._call_api("guild/" + gid)
+            self.guild_cache.put("guild/" + gid, g)
+            log.info(f"Guild cache hit ratio {self.guild_cache.hit_ratio():.0%}")
+        else:
+            self.metrics.cache_hit("guild")
         return g
 
+    def _call_cached(self, endpoint):
+        if not self.cache:
+            return self._call_api(endpoint)
+        key = cache_key(endpoint)
+        res = self.cache.get(key)
+        if res is None:
+            res = self._call_api(endpoint)
+            self.cache.put(key, res)
+        else:
+            self.metrics.cache_hit(endpoint)
+        return res
+
     def _call_api(self, endpoint, *, key=None):
-        url = self._base_url + endpoint + "?lang=" + config.lang
-        log.debug(f"Calling {endpoint}, {key}")
+        separator = "&" if "?" in endpoint else "?"
+        url = self._base_url + endpoint + separator + "lang=" + config.lang
+        # Identical requests in flight at the same time, e.g. from enricher threads, share one response
+        auth = "Bearer " + key if key else self.__headers.get("Authorization")
+        if not endpoint.startswith(NEGATIVE_CACHED):
+            return self.flights.do((url, auth), self._request, url, endpoint, key)
+        code = self.failures.get((url, auth))
+        if code:
+            raise APIError(code)
+        try:
+            return self.flights.do((url, auth), self._request, url, endpoint, key)
+        except APIError as e:
+            self.failures.add((url, auth), e.code)
+            raise
+
+    def _request(self, url, endpoint, key):
+        log.debug(f"Calling {endpoint}" + (" with explicit key" if key else ""))
+        if not self.breaker.allow():
+            log.debug(f"Circuit open, skipping {endpoint}")
+            raise APIError(503)
+        # The breaker counts calls, not attempts: None leaves it alone, e.g. when rate limited
+        healthy = None
         try:
-            if key:
-                headers = {**self.__headers, **{"Authorization": "Bearer " + key}}
-                r = requests.get(url, headers=headers)
+            for attempt in range(self.retries + 1):
+                self.limiter.acquire()
+                start = time.monotonic()
+                try:
+                    validator = None
+                    if key:
+                        headers = {**self.__headers, **{"Authorization": "Bearer " + key}}
+                    else:
+                        headers = self.__headers
+                    if not key and endpoint.startswith(VALIDATED):
+                        with self._validator_lock:
+                            validator = self._validators.get(url)
+                        if validator:
+                            headers = {**headers, **validator[0]}
+                    r = self.session.get(url, headers=headers, timeout=self.timeout)
+                except:
+                    self.metrics.record(endpoint, "failed", (time.monotonic() - start) * 1000, 0)
+                    if attempt < self.retries:
+                        time.sleep(backoff(attempt))
+                        continue
+                    log.error(f"Connection to {url} failed. Check connection.")
+                    healthy = False
+                    raise APIError(1)
+                self.metrics.record(endpoint, r.status_code, (time.monotonic() - start) * 1000, len(r.content))
+
+                if r.status_code == 429:
+                    if attempt < self.retries:
+                        log.debug(f"{endpoint} rate limited, retrying")
+                        time.sleep(retry_after(r) or backoff(attempt))
+                        continue
+                    raise APIError(r.status_code)
+                if r.status_code >= 500:
+                    if attempt < self.retries:
+                        log.debug(f"{endpoint} returned {r.status_code}, retrying")
+                        time.sleep(backoff(attempt))
+                        continue
+                    healthy = False
+                    raise APIError(r.status_code)
+                healthy = True
+                if r.status_code == 304 and validator:
+                    # Unchanged, reuse the body we already have without downloading or decoding it
+                    with self._validator_lock:
+                        if url in self._validators:
+                            self._validators.move_to_end(url)
+                        self.bytes_saved += validator[2]
+                    log.debug(f"{endpoint} not modified, {self.bytes_saved} bytes saved so far")
+                    return validator[1]
+                if r.status_code != 200:
+                    raise APIError(r.status_code)
+                res = r.json()
+                if not key and endpoint.startswith(VALIDATED):
+                    self._store_validator(url, r, res)
+                return res
+        finally:
+            if healthy:
+                self.breaker.success()
+            elif healthy is False:
+                self.breaker.failure()
             else:
-                r = self.__session.get(url)
-        except:
-            log.error(f"Connection to {url} failed. Check connection.")
-            raise APIError(1)
+                self.breaker.release()
 
-        if r.status_code != 200:
-            raise APIError(r.status_code)
-        return r.json()
+    def _store_validator(self, url, r, res):
+        conditions = {}
+        if r.headers.get("ETag"):
+            conditions["If-None-Match"] = r.headers["ETag"]
+        if r.headers.get("Last-Modified"):
+            conditions["If-Modified-Since"] = r.headers["Last-Modified"]
+        if not conditions:
+            return
+        with self._validator_lock:
+            old = self._validators.pop(url, None)
+            if old:
+                self._validator_bytes -= old[2]
+            self._validators[url] = (conditions, res, len(r.content))
+            self._validator_bytes += len(r.content)
+            while (len(self._validators) > self.max_validators
+                   or self._validator_bytes > self.max_validator_bytes):
+                self._validator_bytes -= self._validators.popitem(last=False)[1][2]
 
 
 class MultiApi:
-    def __init__(self, keys):
-        self._unauthenticated_client = GW2Api()
-        self._clients = [GW2Api(k) for k in keys]
-        self._clients = [c for c in self._clients if c._authenticated]
-        self._authenticated = len(self._clients) != 0
+    def __init__(self, keys, base_url=BASE_URL, deadline=5):
+        self.cache = ApiCache()
+        # Not tied to the game build, so it gets its own file that set_build never clears
+        self.guilds = ApiCache("gw2rpc_guilds.db", ttl=24 * 3600, max_entries=500)
+        self.characters = CharacterIndex()
+        self._indexed_at = 0
+        self._unauthenticated_client = GW2Api(cache=self.cache, base_url=base_url)
+        self._clients = []
+        # Keys verified after the deadline are added from executor threads
+        self._clients_lock = threading.Lock()
+        self._authenticated = False
         self._last_used_client = None
-        self.account, self.world = (
-            self._clients[0].account,
-            self._clients[0].world) if self._authenticated else (None, None)
+        self.account, self.world = None, None
+        self._verify_clients(
+            [GW2Api(k, base_url=base_url, verify=False, guild_cache=self.guilds) for k in keys], deadline)
+
+    def _verify_clients(self, clients, deadline):
+        """
+        Verifies all keys concurrently. Keys not verified within deadline seconds are added
+        in the background once they are, so startup does not wait on slow responses
+        """
+        if not clients:
+            return
+        start = time.time()
+        executor = ThreadPoolExecutor(max_workers=len(clients), thread_name_prefix="verify")
+        futures = {c: executor.submit(c.verify) for c in clients}
+        done, not_done = wait(futures.values(), timeout=deadline)
+        # Keys verified in time keep the order of the config
+        for client, future in futures.items():
+            if future in done:
+                self._add_client(client)
+            else:
+                future.add_done_callback(lambda f, c=client: self._add_client(c))
+        executor.shutdown(wait=False)
+        log.info(f"Verified {len(self._clients)}/{len(clients)} API keys in {time.time() - start:.2f}s, "
+                 f"{len(not_done)} still pending")
+
+    def _add_client(self, client):
+        if not client._authenticated:
+            return
+        with self._clients_lock:
+            # Replace instead of append, other threads may be iterating over the list
+            self._clients = self._clients + [client]
+            if not self._authenticated:
+                self.account, self.world = client.account, client.world
+                self._authenticated = True
+        threading.Thread(target=self._index_characters, args=[client], daemon=True).start()
+
+    def _use(self, client):
+        with self._clients_lock:
+            self._last_used_client = client
+            self.account, self.world = client.account, client.world
+
+    def _index_characters(self, client):
+        try:
+            self.characters.update(client.account, client.get_character_names())
+        except APIError:
+            log.debug(f"Could not list characters of {client.account}")
+
+    def _refresh_index(self, interval=60):
+        if time.time() - self._indexed_at < interval:
+            return
+        self._indexed_at = time.time()
+        for client in self._clients:
+            threading.Thread(target=self._index_characters, args=[client], daemon=True).start()
+
+    def _owning_client(self, name):
+        account = self.characters.get(name)
+        for client in self._clients:
+            if account and client.account == account:
+                return client
+        return None
+
+    def set_build(self, build_id):
+        self.cache.set_build(build_id)
 
     def get_map_info(self, map_id):
         return self._unauthenticated_client.get_map_info(map_id)
@@ -111,17 +397,34 @@ class MultiApi:
     def get_continent_info(self, map_info):
         return self._unauthenticated_client.get_continent_info(map_info)
 
+    def get_all_maps(self):
+        return self._unauthenticated_client.get_all_maps()
+
+    def get_floor(self, continent_id, floor):
+        return self._unauthenticated_client.get_floor(continent_id, floor)
+
     def get_character(self, name):
-        if self._last_used_client:
+        owner = self._owning_client(name)
+        if owner:
+            try:
+                c = owner.get_character(name)
+                self._use(owner)
+                return c
+            except APIError:
+                pass
+        # Unknown or stale index entry, refresh it in the background and search all keys
+        self._refresh_index()
+        if self._last_used_client and self._last_used_client is not owner:
             try:
                 return self._last_used_client.get_character(name)
             except APIError:
                 pass
         for client in self._clients:
+            if client is owner or client is self._last_used_client:
+                continue
             try:
                 c = client.get_character(name)
-                self._last_used_client = client
-                self.account, self.world = client.account, client.world
+                self._use(client)
                 return c
             except APIError:
                 pass
@@ -135,4 +438,26 @@ class MultiApi:
         return self._unauthenticated_client.get_guild(gid)
 
 
-api = MultiApi(config.api_keys)
+_api = None
+_api_lock = threading.Lock()
+
+
+def get_api():
+    """
+    Returns the shared API client, constructing it from the configured keys on first use
+    Importing this module makes no network calls, they happen here
+    """
+    global _api
+    with _api_lock:
+        if _api is None:
+            _api = MultiApi(config.api_keys)
+        return _api
+
+
+def set_api(client):
+    """
+    Replaces the shared API client, e.g. with a fake or one pointed at a local server
+    """
+    global _api
+    with _api_lock:
+        _api = client
@@ -0,0 +1,147 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger()
+
+
+class ApiCache:
+    """
+    Persistent cache for GW2 API responses, stored in SQLite
+    Entries expire after ttl seconds, are dropped when the game build changes and the least recently used
+    ones are evicted beyond max_entries
+    """
+    def __init__(self, path="gw2rpc_cache.db", ttl=7 * 24 * 3600, max_entries=5000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._build_id = None
+        self._lock = threading.Lock()
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._create_tables()
+        except sqlite3.Error:
+            log.error(f"Could not open {path}, API responses will only be cached in memory")
+            self._db = sqlite3.connect(":memory:", check_same_thread=False)
+            self._create_tables()
+
+    def _create_tables(self):
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, value TEXT, stored REAL, accessed REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, stored FROM responses WHERE key = ?", (key, )).fetchone()
+            if not row or now - row[1] > self.ttl:
+                self.misses += 1
+                return None
+            with self._db:
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                 [(key, json.dumps(value), now, now) for key, value in items])
+            self._db.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)", (self.max_entries, ))
+
+    def set_build(self, build_id):
+        """
+        Drops all entries if the game build differs from the one the cache was filled with
+        """
+        if not build_id or build_id == self._build_id:
+            return
+        self._build_id = build_id
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'build'").fetchone()
+            if row and row[0] == str(build_id):
+                return
+            if row:
+                log.info(f"Game build changed to {build_id}, clearing API cache")
+                self._db.execute("DELETE FROM responses")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('build', ?)", (str(build_id), ))
+
+
+class CharacterIndex:
+    """
+    Persistent character name -> account name index, so a character lookup goes to the owning key right away
+    """
+    def __init__(self, path="gw2rpc_characters.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.owners = json.load(f)
+        except (OSError, ValueError):
+            self.owners = {}
+
+    def get(self, name):
+        return self.owners.get(name)
+
+    def update(self, account, names):
+        with self._lock:
+            # Drop characters the account no longer has, e.g. deleted or renamed ones
+            owners = {n: a for n, a in self.owners.items() if a != account}
+            owners.update((n, account) for n in names)
+            if owners == self.owners:
+                return
+            self.owners = owners
+            try:
+                with open(self.path, "w", encoding="utf-8") as f:
+                    json.dump(owners, f)
+            except OSError:
+                log.error(f"Could not write {self.path}")
+
+
+class NegativeCache:
+    """
+    Remembers failed lookups so they are not retried on every tick
+    Not found answers (404) are kept for not_found_ttl seconds, transient errors only for error_ttl
+    """
+    def __init__(self, not_found_ttl=3600, error_ttl=30, max_entries=1000, clock=time.monotonic):
+        self.not_found_ttl = not_found_ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expiry, error code), oldest first
+        self.entries = OrderedDict()
+
+    def add(self, key, code):
+        ttl = self.not_found_ttl if code == 404 else self.error_ttl
+        with self._lock:
+            self.entries[key] = (self._clock() + ttl, code)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        """
+        Returns the error code of a failed lookup that has not expired yet, otherwise None
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            if self._clock() >= entry[0]:
+                del self.entries[key]
+                return None
+            return entry[1]
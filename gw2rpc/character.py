@@ -1,4 +1,4 @@
-from .api import api
+from .api import get_api
 
 PROFESSIONS = {
     1: "Guardian",
@@ -56,6 +56,7 @@ class Character:
             self.race = ""
         self.__api_info = None
 
+        api = get_api()
         if query_guild and api._authenticated:
             self.__api_info = api.get_character(self.name)
 
@@ -84,7 +85,7 @@ class Character:
             gid = self.__api_info.get("guild")
             if gid:
                 try:
-                    res = api.get_guild(gid)
+                    res = get_api().get_guild(gid)
                     tag = " [{}]".format(res["tag"])
                 except:
                     pass
@@ -0,0 +1,51 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger()
+
+
+class Enricher:
+    """
+    Runs API lookups on a thread pool so the presence loop never waits on HTTP
+    Callers poll get() every tick: it starts the lookup the first time a key is asked for
+    and returns None until the result is there
+    """
+    def __init__(self, workers=4, budget=3, expire=60, on_done=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enricher")
+        # Seconds a lookup may take before it is reported as slow
+        self.budget = budget
+        # Seconds after which finished but never collected results are dropped
+        self.expire = expire
+        # Called from the worker thread when a lookup finished, e.g. to wake the presence loop
+        self.on_done = on_done
+        self.pending = {}
+
+    def get(self, key, fn, *args):
+        """
+        key is a tuple starting with the stage name, e.g. ("map", 15)
+        Exceptions raised by fn are re-raised once to the caller that collects the result
+        """
+        self._drop_expired()
+        entry = self.pending.get(key)
+        if entry is None:
+            future = self.executor.submit(fn, *args)
+            if self.on_done:
+                future.add_done_callback(lambda f: self.on_done())
+            self.pending[key] = [future, time.monotonic(), False]
+            return None
+        future, started, warned = entry
+        if not future.done():
+            if not warned and time.monotonic() - started > self.budget:
+                log.warning(f"Lookup {key[0]} exceeded its {self.budget}s budget")
+                entry[2] = True
+            return None
+        del self.pending[key]
+        log.debug(f"Lookup {key[0]} took {(time.monotonic() - started) * 1000:.0f}ms")
+        return future.result()
+
+    def _drop_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (f, started, _) in self.pending.items()
+                    if f.done() and now - started > self.expire]:
+            del self.pending[key]
@@ -9,18 +9,24 @@ import math
 from datetime import datetime, timedelta
 import time
 
-import psutil
 import requests
-from infi.systray import SysTrayIcon
 import gettext
 import urllib.parse
 
-from .api import APIError, api  
+from .api import APIError, get_api
+from .cache import NegativeCache
 from .character import Character
+from .enrich import Enricher
 from .mumble import MumbleData
+from .prefetch import MapPrefetcher
+from .process import ProcessWatcher, RPC_NAME
+from .pipeline import Frame, LatestValue, Stage
+from .scheduler import Scheduler
+from .webhook import WebhookDispatcher
 from .settings import config
-from .sdk import DiscordSDK
-from .lib.discordsdk import exception as sdk_exception
+from .spatial import PointIndex
+from .registry import Registry
+from .sdk import ActivityPublisher, DiscordSDK
 
 import sys
 import os
@@ -43,7 +49,8 @@ log.setLevel(config.log_level)
 locales_path = resource_path("./locales")
 #locales_path = resource_path("../locales")
 
-lang = gettext.translation('base', localedir=locales_path, languages=[config.lang])
+# Untranslated English when the .mo files were not generated, e.g. headless runs from the source tree
+lang = gettext.translation('base', localedir=locales_path, languages=[config.lang], fallback=True)
 lang.install()
 _ = lang.gettext
 
@@ -80,7 +87,12 @@ def create_msgbox(description, *, title='GW2RPC', code=0):
 
 
 class GW2RPC:
-    def __init__(self):
+    def __init__(self, headless=False, sink=None, processes=None, api=None):
+        """
+        headless runs without systray and message boxes, publishing to sink instead of Discord
+        processes replaces the ProcessWatcher, e.g. with gw2rpc.headless.simulated_processes
+        api replaces the shared client from get_api, e.g. a MultiApi without keys
+        """
 
 
         def fetch_registry():
@@ -97,7 +109,7 @@ class GW2RPC:
                 # Server side error, fall back to local registry
                 log.error("Could not fetch the web registry")
                 return None
-            return res.json()
+            return Registry(res.json())
 
 
         def fetch_support_invite():
@@ -107,24 +119,44 @@ class GW2RPC:
             except:
                 return None
 
-        self.sdk = DiscordSDK(GW2RPC_APP_ID)
+        self.headless = headless
+        self.sdk = sink or DiscordSDK(GW2RPC_APP_ID)
+        self.publisher = ActivityPublisher(self.sdk)
         self.registry = fetch_registry()
         self.support_invite = fetch_support_invite()
+        self.api = api or get_api()
+        # Started with the first game build known, see get_activity
+        self.prefetcher = MapPrefetcher(self.api) if config.prefetch_maps else None
         self.process = None
         self.last_map_info = None
         self.last_continent_info = None
         self.last_boss = None
         self.boss_timestamp = None
         self.commander_webhook_sent = False
-        self.no_pois = set()
+        self.webhooks = WebhookDispatcher()
+        self.no_pois = NegativeCache()
+        # map_id -> PointIndex, kept for the whole session so revisits don't rebuild
+        self.poi_indexes = {}
         self.check_for_updates()
         self.game = None
+        self.processes = processes or ProcessWatcher()
+        self.processes.refresh()
         self.mumble_links = self.get_mumble_links()
         self.mumble_objects = self.create_mumble_objects()
-        self.timeticks = 0
         self.prev_char = None
-        # Interval to sleep for the while true loop. Will increase to 5 if game is not running to reduce CPU usage
-        self.interval = 1 / 2
+        # Set by the scheduler every 20 minutes, the time it takes to update the guild in the GW2 API
+        self.refresh_guild = False
+        self.scheduler = Scheduler()
+        # Latest-value queues between the sampler, enricher and publisher stages
+        self.frames = LatestValue()
+        self.activities = LatestValue()
+        self.stages = []
+        self.position = None
+        self.enricher = Enricher(on_done=lambda: self.scheduler.wake("presence"))
+        self.character_key = None
+        # (MumbleData, uiTick) the last activity was built from
+        self.last_frame = None
+        self.last_activity = None
         # Select the first mumble object as initially in focus
         if len(self.mumble_objects) > 0:
             self.game = self.mumble_objects[0][0]
@@ -141,6 +173,9 @@ class GW2RPC:
         return menu_options
 
     def create_systray(self):
+        # Windows only, not needed in headless mode
+        from infi.systray import SysTrayIcon
+
         def icon_path():
             try:
                 return os.path.join(sys._MEIPASS, "icon.ico")
@@ -160,21 +195,7 @@ class GW2RPC:
         Adds them to a list, or adds the default 'MumbleLink' if there are no parameters
         Returns a list of tuples of str: mumbleLink and process
         """
-        mumble_links = set()
-        try:
-            for process in psutil.process_iter():
-                pinfo = process.as_dict(attrs=['pid', 'name', 'cmdline'])
-                if pinfo['name'].lower() in ("Gw2-64.exe".lower(), "Gw2.exe".lower()):
-                    cmdline = pinfo['cmdline']
-                    try:
-                        mumble_links.add((cmdline[cmdline.index('-mumble') + 1], process))
-                    except ValueError:
-                        mumble_links.add(("MumbleLink", process))
-                    except AttributeError:
-                        log.error("GW2 process crashed!")
-                        continue
-        except psutil.NoSuchProcess:
-            pass
+        mumble_links = self.processes.mumble_links()
         log.debug(f"Mumble Links found: {mumble_links}")
         return mumble_links
 
@@ -192,6 +213,15 @@ class GW2RPC:
         log.debug(f"Mumble Link objects created: {mumble_objects}")
         return mumble_objects
 
+    def crash(self, e):
+        log.critical(f"GW2RPC v{VERSION} has crashed", exc_info=e)
+        if not self.headless:
+            create_msgbox(
+                "GW2 Rich Presence has crashed.\nPlease check your "
+                "log file and report this to the author!",
+                code=16)
+        self.shutdown()
+
     def shutdown(self, _=None):
         os._exit(0)  # Nuclear option
 
@@ -229,12 +259,16 @@ class GW2RPC:
         build = get_build()
         if not build:
             log.error("Could not retrieve build!")
+            if self.headless:
+                return
             create_msgbox(
                 _("Could not check for updates - check your connection!"))
             return
         if build > VERSION:
             log.info("New version found! Current: {} New: {}".format(
                 VERSION, build))
+            if self.headless:
+                return
             res = create_msgbox(
                 _("There is a new update for GW2 Rich Presence available. "
                 "Would you like to be taken to the download page now?"),
@@ -257,7 +291,7 @@ class GW2RPC:
         map_name = map_info["name"]
         region = str(map_info.get("region_id", "thanks_anet"))
 
-        position = self.game.get_position()
+        position = self.position
         #print("{} {} Region {}".format(map_id, map_name, region))
         #print("{} {} {}".format(position.x, position.y, position.z))
         #m_x, m_y = self.convert_mumble_coordinates(map_info, position)
@@ -267,37 +301,19 @@ class GW2RPC:
         if self.registry:
             if region == "26":  #  Fractals of the Mists 
                 image = "fotm"
-                for fractal in self.registry["fractals"]:
+                fractal = self.registry.fractals.get(map_id)
+                if fractal:
                     state, name = self.find_fractal_boss(map_id, fractal, position)
                     if name:
                         image = name.replace('.', "_").lower().replace(" ", "_")
-                    if state:
-                        break
-
-                    if fractal["id"] == map_id:
-                        state = _("in ") + _("fractal") + ": " + _(fractal["name"]) 
-                        break
                 else:
-                    if not state:
-                        state = _("in ") + _("Fractals of the Mists")
+                    state = _("in ") + _("Fractals of the Mists")
                 name = "Fractals of the Mists"
             else:
-                if map_name in self.registry["special"]:
-                    # Not sure if this even works but i dont want to touch it
-                    image = self.registry["special"][map_name]
-                elif str(map_id) in self.registry["special"]:
-                    # Many strike instances share the same ID, with this we only have to keep one asset in discord
-                    image = self.registry["special"][str(map_id)]
-                elif map_id in self.registry["valid"]:
-                    image = map_id
-                elif region in self.registry["regions"]:
-                    image = self.registry["regions"][region]
-                else:
-                    image = "default"
+                image = self.registry.get_image(map_id, map_name, region)
                 name = map_name
-                mounts = self.registry["mounts"].keys()
-                if not config.hide_mounts and mount_index and str(mount_index) in mounts:
-                    mount = self.registry["mounts"][str(mount_index)]
+                mount = self.registry.mounts.get(mount_index)
+                if not config.hide_mounts and mount_index and mount:
                     state = _("on") + " " + _(mount) + " " + _("in ") + name
                 else:
                     state = _("in ") + name
@@ -364,24 +380,10 @@ class GW2RPC:
             "large_text": name + " - {}".format(map_info["name"])
         }
 
-    def get_activity(self):
-        def get_region():
-            world = api.world
-            if world:
-                for k, v in worlds.items():
-                    if world in v:
-                        return " [{}]".format(k)
-            return ""
-
-        def get_closest_poi(map_info, continent_info):
-            ##region = map_info.get("region_name")
-            region = map_info.get("region_id")
-            if config.disable_pois:
-                return None
-            if config.disable_pois_in_wvw and region == 7:
-                return None
-            return self.find_closest_point(map_info, continent_info)
-
+    def sample(self):
+        """
+        Reads the MumbleLink of the active Gw2 instance, returns a Frame with data None if there is nothing to show
+        """
         def update_mumble_links():
             all_links = self.get_mumble_links()
             new_links = all_links.difference(self.mumble_links)
@@ -421,8 +423,36 @@ class GW2RPC:
         self.process = active_p if active_p else self.process
         # TODO maybe self.process instead of active_p here?
         data = self.game.get_mumble_data(process=active_p)
+        position = self.game.get_position() if data else None
+        return Frame(self.game, data, self.game.last_tick, self.game.last_timestamp, self.game.build_id, position)
+
+    def get_activity(self, frame):
+        def get_region():
+            world = self.api.world
+            if world:
+                for k, v in worlds.items():
+                    if world in v:
+                        return " [{}]".format(k)
+            return ""
+
+        def get_closest_poi(map_info, continent_info):
+            ##region = map_info.get("region_name")
+            region = map_info.get("region_id")
+            if config.disable_pois:
+                return None
+            if config.disable_pois_in_wvw and region == 7:
+                return None
+            return self.find_closest_point(map_info, continent_info)
+
+        data = frame.data
         if not data:
             return None
+        # Idle frame, nothing changed since the last activity was built.
+        # Still rebuild when the guild info is due for a refresh
+        if (self.last_frame == (frame.game, frame.tick) and not self.enricher.pending
+                and not self.refresh_guild):
+            return self.last_activity
+        self.position = frame.position
         buttons = []
         map_id = data["map_id"]
         is_commander = data["commander"]
@@ -430,51 +460,69 @@ class GW2RPC:
         in_combat = data["in_combat"]
         copy_paste_url = None
         point = None
+        self.api.set_build(frame.build_id)
+        if self.prefetcher and frame.build_id:
+            # Only after set_build, a changed build would clear everything prefetched so far
+            self.prefetcher.start()
+            self.prefetcher = None
         try:
             if self.last_map_info and map_id == self.last_map_info["id"]:
                 map_info = self.last_map_info
             else:
-                map_info = api.get_map_info(map_id)
+                map_info = self.enricher.get(("map", map_id), self.api.get_map_info, map_id)
                 self.last_map_info = map_info
-            # 800 ticks are approx 20 minutes (not accurate!). Time it takes to update Guild in GW2 API. 
-            # Query again after this time interval, else keep the previously known guild
-            if (not self.prev_char) or ((self.prev_char and data["name"] != self.prev_char.name)) or (self.timeticks == 0):
+            # Query again when refresh_guild is set, else keep the previously known guild
+            if (not self.prev_char) or ((self.prev_char and data["name"] != self.prev_char.name)) or self.refresh_guild:
                 # Query GW2API on character swap or every 20 minutes for guild info
-                character = Character(data)
-                # Keep the guild tag from the old character
-                tag = character.guild_tag
-            else:
-                # Else just create a char object without API calls, keep guild tag
+                self.character_key = ("character", data["name"], time.time())
+                self.refresh_guild = False
+            character = None
+            if self.character_key:
+                character = self.enricher.get(self.character_key, Character, data)
+                if character:
+                    self.character_key = None
+            if not character:
+                # Until the API answered just create a char object without API calls, keep guild tag
                 character = Character(data, query_guild=False)
-                character.guild_tag = self.prev_char.guild_tag
-                tag = self.prev_char.guild_tag if self.prev_char else character.guild_tag
+                if self.prev_char and self.prev_char.name == character.name:
+                    character.guild_tag = self.prev_char.guild_tag
+            tag = character.guild_tag
             self.prev_char = character
-        except APIError:
-            log.error("API Error!")
+        except APIError as e:
+            log.error(f"API Error {e.code}!")
             self.last_map_info = None
+            if e.code != 404:
+                # Transient, and replayed from the negative cache for a while, keep showing the last known activity
+                return self.last_activity
             return None
+        if not map_info:
+            # Map lookup still running, keep showing the last activity until it arrived
+            return self.last_activity
         state, map_asset = self.get_map_asset(map_info, mount_index=mount_index)
 
         tag = tag if config.display_tag else ""
         try:
-            if map_id in self.no_pois or "continent_id" not in map_info:
+            if "continent_id" not in map_info:
                 raise APIError(404)
-            if (self.last_continent_info
+            if self.no_pois.get(map_id):
+                # Failed recently, wait for the entry to expire instead of asking again
+                self.last_continent_info = None
+            elif (self.last_continent_info
                     and map_id == self.last_continent_info["id"]):
                 continent_info = self.last_continent_info
             else:
-                continent_info = api.get_continent_info(map_info)
+                continent_info = self.enricher.get(("continent", map_id), self.api.get_continent_info, map_info)
                 self.last_continent_info = continent_info
-        except APIError:
+        except APIError as e:
             self.last_continent_info = None
-            self.no_pois.add(map_id)
+            self.no_pois.add(map_id, e.code)
         details = character.name + tag
-        timestamp = self.game.last_timestamp
-        if self.registry and str(map_id) in self.registry.get("raids", {}):
+        timestamp = frame.timestamp
+        if self.registry and map_id in self.registry.raids:
             state, map_asset = self.get_raid_assets(map_info, mount_index)
-            timestamp = self.boss_timestamp or self.game.last_timestamp
-        elif self.registry and map_id in [f["id"] for f in self.registry["fractals"]]:
-            timestamp = self.boss_timestamp or self.game.last_timestamp
+            timestamp = self.boss_timestamp or frame.timestamp
+        elif self.registry and map_id in self.registry.fractals:
+            timestamp = self.boss_timestamp or frame.timestamp
         else:
             self.last_boss = None
             if self.last_continent_info:
@@ -504,8 +552,7 @@ class GW2RPC:
             if not config.disable_raid_announce_in_wvw or region != 7:
                 copy_paste_url = copy_paste_url or "https://gw2rpc.info"
                 chat_link = f"*{point['name']}: `{point['chat_link']}`*" if point else None
-                for u in config.webhooks:
-                    self.send_webhook(u, character.name, _(state), copy_paste_url, character.profession, chat_link)
+                self.send_webhook(config.webhooks, character.name, _(state), copy_paste_url, character.profession, chat_link)
                 self.commander_webhook_sent = True
         if not is_commander and self.commander_webhook_sent:
             self.commander_webhook_sent = False
@@ -522,6 +569,8 @@ class GW2RPC:
             },
             "buttons": buttons
         }
+        self.last_frame = (frame.game, frame.tick)
+        self.last_activity = activity
         return activity
 
     def in_character_selection(self):
@@ -552,26 +601,24 @@ class GW2RPC:
         y = crect[0][1] + (mrect[1][1] - position.y) / 24
         return x, y
 
+    def get_poi_index(self, map_id, continent_info):
+        index = self.poi_indexes.get(map_id)
+        if index is None:
+            index = PointIndex(continent_info["points_of_interest"])
+            self.poi_indexes[map_id] = index
+            log.debug(f"Built POI index for map {map_id} with {index.size} points")
+        return index
+
     def find_closest_point(self, map_info, continent_info):
-        position = self.game.get_position()
+        position = self.position
         x_coord, y_coord = self.convert_mumble_coordinates(map_info, position)
-        lowest_distance = float("inf")
-        point = None
-        for item in continent_info["points_of_interest"].values():
-            if "name" not in item:
-                continue
-            distance = (item["coord"][0] - x_coord)**2 + (
-                item["coord"][1] - y_coord)**2
-            if distance < lowest_distance:
-                lowest_distance = distance
-                point = item
-        return point
+        return self.get_poi_index(map_info["id"], continent_info).nearest(x_coord, y_coord)
 
     def find_closest_boss(self, map_info):
-        position = self.game.get_position()
+        position = self.position
         x_coord, y_coord = self.convert_mumble_coordinates(map_info, position)
         closest = None
-        for boss in self.registry["raids"][str(map_info["id"])]:
+        for boss in self.registry.raids[map_info["id"]]:
             distance = math.sqrt((boss["coord"][0] - x_coord)**2 +
                                  (boss["coord"][1] - y_coord)**2)
             if "radius" in boss and distance < boss["radius"]:
@@ -610,7 +657,7 @@ class GW2RPC:
                 state = _("in ") + _("fractal") + ": " + _(fractal["name"])
         return state, None
 
-    def send_webhook(self, url, name, map, website_url, profession, poi=None):
+    def send_webhook(self, urls, name, map, website_url, profession, poi=None):
         # Get timestamp with utc offset
         timestamp = datetime.now()
         ts = time.time()
@@ -653,13 +700,7 @@ class GW2RPC:
         if poi: 
             data["embeds"][0]["fields"].append({"name": _("Closest PoI"), "value": f"{poi}"})
 
-        try:
-            result = requests.post(url, json = data)
-            result.raise_for_status()
-        except requests.exceptions.HTTPError as err:
-            log.error(err)
-        except:
-            log.error(f"Invalid webhook url: {url}")
+        self.webhooks.send(urls, data)
 
     def main_loop(self):
         def update_gw2_process():
@@ -670,20 +711,11 @@ class GW2RPC:
                 else:
                     if config.close_with_gw2:
                         shutdown = True
-            try:
-                names = []
-                for process in psutil.process_iter(attrs=['name']):
-                    name = process.info['name']
-                    names.append(name)
-                    if name.lower() in ("Gw2-64.exe".lower(), "Gw2.exe".lower()):
-                        log.debug(f"Found GW2 process: {process.name}")
-                        self.process = process
-                        return
-                else: 
-                    log.debug(f"GW2 process not found, List of processes: {names}")
-            except psutil.NoSuchProcess:
-                log.debug("A process exited while iterating over the process list.")
-                pass
+            gw2_processes = self.processes.gw2_processes()
+            if gw2_processes:
+                self.process = gw2_processes[0]
+                return
+            log.debug("GW2 process not found")
 
             if shutdown:
                 self.shutdown()
@@ -691,72 +723,109 @@ class GW2RPC:
             raise GameNotRunningError
 
         def check_for_running_rpc():
-            count = 0
-            try:
-                for process in psutil.process_iter(attrs=['name']):
-                    name = process.info['name']
-                    if name == "gw2rpc.exe":
-                        count += 1
-                    if count > 2:
-                        break
-                else:
-                    return
-            except psutil.NoSuchProcess:
-                log.debug("A process exited while iterating over the process list.")
-                pass   
+            # The bundled exe runs as two processes, so a third one means another instance
+            if self.processes.count(RPC_NAME) <= 2:
+                return
             log.info("Another gw2rpc process is already running, exiting.")
-            if self.sdk.app:
-                self.sdk.activity_manager.clear_activity(self.sdk.callback)
-                self.sdk.close()
-                log.debug("Killing SDK")
+            self.sdk.clear()
             self.shutdown()
 
+        def scan_processes():
+            known = self.processes.mumble_links()
+            self.processes.refresh()
+            if self.processes.mumble_links() != known:
+                # Game started or exited, don't wait for the next presence update
+                self.scheduler.wake("presence")
+
+        def update_presence():
+            try:
+                update_gw2_process()
+                if self.game and not self.game.memfile:
+                    self.game.create_map()
+                self.frames.put(self.sample())
+            except GameNotRunningError:
+                if self.game:
+                    self.game.close_map()
+                # Tells the later stages to clear the presence
+                self.frames.put(None)
+
+        def presence_interval():
+            # Slow down while there is nothing or little to show to reduce CPU usage
+            if not self.process:
+                return 5
+            if not self.game or not self.game.in_focus:
+                return 2
+            if self.game.in_combat:
+                return 1
+            return 1 / 2
+
+        def enrich(frame):
+            if not frame:
+                return None
+            try:
+                return self.get_activity(frame) or self.in_character_selection()
+            except requests.exceptions.ConnectionError:
+                return None
+
+        def publish(activity):
+            if not activity:
+                self.sdk.clear()
+                self.publisher.reset()
+                return
+            if not self.sdk.app:
+                self.sdk.start()
+                self.publisher.reset()
+                log.debug("starting self.sdk")
+            log.debug(activity)
+            try:
+                if self.sdk.app:
+                    self.publisher.publish(activity)
+            except BrokenPipeError:
+                reconnect()
+            run_callbacks()
+
+        def run_callbacks():
+            if not self.sdk.app:
+                return
+            try:
+                # Flushing sends activities held back by the update budget
+                self.publisher.flush()
+                self.sdk.run_callbacks()
+            except BrokenPipeError:
+                reconnect()
+
+        def reconnect():
+            # Discord went away, a new connection is started with the next activity, which is then sent again
+            self.sdk.close()
+            self.publisher.reset()
+
+        def log_stats():
+            log.info("Pipeline stats:\n  " + "\n  ".join(s.stats() for s in self.stages))
+
+        def request_guild_refresh():
+            self.refresh_guild = True
+
         try:
             check_for_running_rpc()
-            self.create_systray()
-            while True:
-                try:
-                    update_gw2_process()
-                    self.interval = 1 / 2
-                    if self.game and not self.game.memfile:
-                        self.game.create_map()
-                    try:
-                        data = self.get_activity()
-                    except requests.exceptions.ConnectionError:
-                        raise GameNotRunningError
-                    if not self.sdk.app:
-                        self.sdk.start()
-                        log.debug("starting self.sdk")
-                    if not data:
-                        data = self.in_character_selection()
-                    log.debug(data)
-                    try:
-                        if self.sdk.app:
-                            self.sdk.set_activity(data)
-                            try:
-                                self.sdk.app.run_callbacks()
-                            except sdk_exception.not_running:
-                                # Probably a bug in the SDK library:
-                                # Crashes if discord is started after RPC is already running
-                                # Need to close the sdk connection and continue
-                                # New sdk connection will be opened on next iteration
-                                self.sdk.close()
-                                continue
-                    except BrokenPipeError:
-                        raise GameNotRunningError  # To start a new connection
-                    self.timeticks = (self.timeticks + 1) % 1000
-                except GameNotRunningError:
-                    self.interval = 5
-                    if self.game:
-                        self.game.close_map()
-                    if self.sdk.app:
-                        self.sdk.activity_manager.clear_activity(self.sdk.callback)
-                        self.sdk.close()
-                time.sleep(self.interval)
-        except Exception as e:
-            log.critical(f"GW2RPC v{VERSION} has crashed", exc_info=e)
-            create_msgbox(
-                "GW2 Rich Presence has crashed.\nPlease check your "
-                "log file and report this to the author!",
-                code=16)
+            if not self.headless:
+                self.create_systray()
+            # Sampler (scheduler) -> enricher -> publisher, a slow stage only makes the next one skip to newer items
+            self.stages = [
+                Stage("enricher", enrich, self.frames, self.activities, on_error=self.crash),
+                # Owns the Discord SDK, runs its callbacks while there is nothing new to publish
+                Stage("publisher", publish, self.activities, idle=1 / 2, on_idle=run_callbacks, on_error=self.crash)
+            ]
+            for stage in self.stages:
+                stage.start()
+            self.scheduler.add("processes", scan_processes, lambda: 2 if self.process else 5)
+            self.scheduler.add("presence", update_presence, presence_interval)
+            self.scheduler.add("guild", request_guild_refresh, 20 * 60)
+            self.scheduler.add("stats", log_stats, 10 * 60)
+            self.scheduler.run()
+        except KeyboardInterrupt:
+            log.info("Interrupted, exiting.")
+            log_stats()
+            self.sdk.clear()
             self.shutdown()
+        except Exception as e:
+            self.crash(e)
@@ -0,0 +1,115 @@
+"""
+Game stand-ins for headless runs, so sampling, enrichment and publishing can be profiled
+and load-tested without Guild Wars 2, e.g. on Linux:
+    rpc = GW2RPC(headless=True, sink=LogSink(), processes=simulated_processes(["MumbleLink"]))
+    FramePlayer(MumbleLinkWriter("MumbleLink"), load_frames("frames.jsonl")).start()
+
+A frames file has one JSON object per line:
+    {"identity": {...}, "position": [x, y, z], "build_id": 150000, "ui_state": 8, "mount_index": 0}
+identity is what the game writes to the link, e.g. {"name": "Some Char", "profession": 1, "spec": 0,
+"race": 0, "map_id": 15, "world_id": 1001, "team_color_id": 0, "commander": false, "fov": 0.9, "uisz": 1}
+"""
+import itertools
+import json
+import logging
+import threading
+import time
+
+import psutil
+
+from .mumble import MumbleData
+from .process import ProcessWatcher
+
+log = logging.getLogger()
+
+
+def load_frames(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class MumbleLinkWriter:
+    """
+    Writes frames to a MumbleLink the way the game does, bumping uiTick with every frame
+    """
+    def __init__(self, mumble_link="MumbleLink"):
+        self.mumble_link = mumble_link
+        self.link = MumbleData(mumble_link)
+        self.link.create_map()
+
+    def write(self, frame):
+        link, context = self.link.link, self.link.context
+        identity = frame["identity"]
+        link.uiVersion = 2
+        link.name = "Guild Wars 2"
+        link.identity = json.dumps(identity)
+        link.fAvatarPosition[:] = frame.get("position", (0, 0, 0))
+        link.context_len = 48
+        context.mapId = identity["map_id"]
+        context.buildId = frame.get("build_id", 0)
+        # In focus by default, bit 7 is in combat
+        context.uiState = frame.get("ui_state", 0b1000)
+        context.mountIndex = frame.get("mount_index", 0)
+        link.uiTick += 1
+
+    def close(self):
+        self.link.close_map()
+
+
+class FramePlayer(threading.Thread):
+    """
+    Writes one frame every interval seconds, from the start again once all are played if loop is set
+    """
+    def __init__(self, writer, frames, interval=1, loop=True):
+        super().__init__(name="FramePlayer", daemon=True)
+        self.writer = writer
+        self.frames = frames
+        self.interval = interval
+        self.loop = loop
+        self.played = 0
+
+    def run(self):
+        frames = itertools.cycle(self.frames) if self.loop else self.frames
+        for frame in frames:
+            self.writer.write(frame)
+            self.played += 1
+            time.sleep(self.interval)
+        log.info(f"Played {self.played} frames")
+
+
+class SimulatedGw2Process:
+    """
+    The parts of psutil.Process the ProcessWatcher and MumbleData look at
+    Has no connections, frames written by MumbleLinkWriter have no server address to check
+    """
+    def __init__(self, pid, mumble_link):
+        self.pid = pid
+        self.mumble_link = mumble_link
+
+    def name(self):
+        return "Gw2-64.exe"
+
+    def cmdline(self):
+        return ["Gw2-64.exe", "-mumble", self.mumble_link]
+
+    def is_running(self):
+        return True
+
+    def connections(self):
+        return []
+
+
+def simulated_processes(mumble_links):
+    """
+    ProcessWatcher seeing one simulated Gw2 process per link and no other processes
+    """
+    # Never real PIDs, so nothing is mistaken for another gw2rpc instance
+    table = {-1 - i: SimulatedGw2Process(-1 - i, m) for i, m in enumerate(mumble_links)}
+
+    def process(pid):
+        try:
+            return table[pid]
+        except KeyError:
+            raise psutil.NoSuchProcess(pid)
+
+    return ProcessWatcher(pids=lambda: list(table), process_factory=process)
@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+log = logging.getLogger()
+
+# Upper bounds of the latency histogram buckets in milliseconds, the last bucket is unbounded
+LATENCY_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.statuses = Counter()
+        self.bytes = 0
+        self.cache_hits = 0
+
+    def add(self, status, latency_ms, size):
+        self.requests += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency_ms <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.latency[i] += 1
+        self.statuses[status] += 1
+        self.bytes += size
+
+    def __str__(self):
+        histogram = " ".join(f"<={b}:{n}" for b, n in zip(LATENCY_BUCKETS, self.latency) if n)
+        if self.latency[-1]:
+            histogram += f" >{LATENCY_BUCKETS[-1]}:{self.latency[-1]}"
+        statuses = " ".join(f"{s}:{n}" for s, n in sorted(self.statuses.items(), key=str))
+        return (f"{self.requests} requests, {self.cache_hits} cache hits, {self.bytes / 1024:.1f} KiB, "
+                f"status [{statuses}], latency ms [{histogram}]")
+
+
+class ApiMetrics:
+    """
+    Request statistics per endpoint family (maps, continents, characters, guild, account, ...)
+    Only the family is recorded, never ids, names or keys
+    """
+    def __init__(self, interval=600):
+        self.interval = interval
+        self.families = {}
+        self._last_summary = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def family(endpoint):
+        return endpoint.split("?")[0].split("/")[0]
+
+    def _stats(self, endpoint):
+        return self.families.setdefault(self.family(endpoint), EndpointStats())
+
+    def record(self, endpoint, status, latency_ms, size):
+        with self._lock:
+            self._stats(endpoint).add(status, latency_ms, size)
+        self.maybe_log()
+
+    def cache_hit(self, endpoint):
+        with self._lock:
+            self._stats(endpoint).cache_hits += 1
+
+    def summary(self):
+        with self._lock:
+            return "\n".join(f"  {f}: {s}" for f, s in sorted(self.families.items()))
+
+    def maybe_log(self):
+        now = time.monotonic()
+        if now - self._last_summary < self.interval:
+            return
+        self._last_summary = now
+        log.info("GW2 API stats:\n" + self.summary())
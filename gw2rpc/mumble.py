@@ -1,10 +1,20 @@
 import ctypes
 import json
 from json.decoder import JSONDecodeError
+import logging
 import mmap
+import os
+import sys
+import tempfile
 import time
 import socket
 
+log = logging.getLogger()
+
+# Named shared memory only exists on Windows, elsewhere the link is a file in this directory,
+# e.g. written by gw2rpc.headless. Note that ctypes sizes differ, so only the same platform can read it
+LINK_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
 class MumbleLinkException(Exception):
     pass
 
@@ -50,10 +60,65 @@ class Link(ctypes.Structure):
 # yapf:enable QA ON
 
 
+class ConnectionCache:
+    """
+    Remembers (pid, server_ip) pairs with a verified ESTABLISHED connection, so that
+    process.connections() only has to be enumerated once per ttl seconds and server
+    """
+    def __init__(self, ttl=15):
+        self.ttl = ttl
+        self.verified = {}
+        self.scans = 0
+        self.saved = 0
+
+    def is_connected(self, process, server_ip):
+        key = (process.pid, server_ip)
+        now = time.monotonic()
+        verified_at = self.verified.get(key)
+        if verified_at is not None and now - verified_at < self.ttl:
+            self.saved += 1
+            return True
+        # Expired or the server changed, forget everything known about this process
+        self.invalidate(process.pid)
+        self.prune(now)
+        self.scans += 1
+        log.debug(f"Scanning connections of {process.pid}, {self.saved} scans saved so far")
+        try:
+            for conn in process.connections():
+                if conn.status == 'ESTABLISHED' and conn.raddr.ip == server_ip:
+                    break
+            else:
+                return False
+        except:
+            # Access denied and the like, assume connected and don't ask again until the ttl ran out
+            pass
+        self.verified[key] = now
+        return True
+
+    def invalidate(self, pid):
+        for key in [k for k in self.verified if k[0] == pid]:
+            del self.verified[key]
+
+    def prune(self, now):
+        """
+        Drops expired entries, including those of processes that exited
+        """
+        for key in [k for k, t in self.verified.items() if now - t >= self.ttl]:
+            del self.verified[key]
+
+
+connection_cache = ConnectionCache()
+
+
 class MumbleData:
-    def __init__(self, mumble_link="MumbleLink"):
+    def __init__(self, mumble_link="MumbleLink", zero_copy=True):
         self.mumble_link = mumble_link
+        # zero_copy maps Link and Context directly onto the shared memory
+        # instead of copying them out of it on every read
+        self.zero_copy = zero_copy
         self.memfile = None
+        self.link = None
+        self.context = None
         self.last_map_id = None
         self.last_timestamp = None
         self.last_character_name = None
@@ -62,14 +127,37 @@ class MumbleData:
         self.in_focus = False
         self.in_combat = False
         self.last_server_ip = None
+        self.build_id = None
+        self.last_tick = None
+        self.last_identity = None
+        self.last_data = None
 
     def create_map(self):
         size_discarded = 256 - self.size_context + 4096 # empty areas of context and description
         memfile_length = self.size_link + self.size_context + size_discarded
-        self.memfile = mmap.mmap(-1, memfile_length, self.mumble_link)
+        if sys.platform == "win32":
+            self.memfile = mmap.mmap(-1, memfile_length, self.mumble_link)
+        else:
+            self.memfile = self.map_file(memfile_length)
+        if self.zero_copy:
+            self.link = Link.from_buffer(self.memfile)
+            self.context = Context.from_buffer(self.memfile, self.size_link)
+
+    def map_file(self, length):
+        fd = os.open(os.path.join(LINK_DIR, self.mumble_link), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < length:
+                os.ftruncate(fd, length)
+            return mmap.mmap(fd, length)
+        finally:
+            os.close(fd)
 
     def close_map(self):
         if self.memfile:
+            # The structures export pointers into the map, release them first
+            # or mmap refuses to close
+            self.link = None
+            self.context = None
             self.memfile.close()
             self.memfile = None
             self.last_map_id = None
@@ -78,6 +166,9 @@ class MumbleData:
             self.in_focus = False
             self.in_combat = False
             self.last_server_ip = None
+            self.last_tick = None
+            self.last_identity = None
+            self.last_data = None
 
     @staticmethod
     def Unpack(ctype, buf):
@@ -86,19 +177,27 @@ class MumbleData:
             ctypes.pointer(cstring), ctypes.POINTER(ctype)).contents
         return ctype_instance
 
-    def get_mumble_data(self, process=None):
+    def read_link(self):
+        """
+        Returns the Link and Context structures of the current frame
+        In zero copy mode these are views on the memfile, so every field access reads shared memory directly
+        """
+        if self.zero_copy:
+            return self.link, self.context
         self.memfile.seek(0)
         data = self.memfile.read(self.size_link)
         context = self.memfile.read(self.size_context)
-        result = self.Unpack(Link, data)
-        result_context = self.Unpack(Context, context)
-        if not result.identity:
+        return self.Unpack(Link, data), self.Unpack(Context, context)
+
+    def decode_frame(self, identity, result_context):
+        if not identity:
             return None
         try:
-            data = json.loads(result.identity)
+            data = json.loads(identity)
         except JSONDecodeError:
             return None
 
+        self.build_id = result_context.buildId
         uiState = result_context.uiState
         self.in_focus = bool(uiState & 0b1000)
         self.in_combat = bool(uiState & 0b1000000)
@@ -113,18 +212,28 @@ class MumbleData:
         else:
             self.last_server_ip = None
 
-        if process and self.last_server_ip:
-            try:
-                for conn in process.connections():
-                    if conn.status == 'ESTABLISHED' and conn.raddr.ip == self.last_server_ip:
-                        break
-                else:
-                    return None
-            except:
-                pass
-
         data["mount_index"] = result_context.mountIndex
         data["in_combat"] = self.in_combat
+        return data
+
+    def get_mumble_data(self, process=None):
+        result, result_context = self.read_link()
+        tick = result.uiTick
+        identity = result.identity
+        # The game bumps uiTick with every frame it writes. Same tick and identity means
+        # nothing changed, so the previously decoded snapshot is still valid
+        if tick != self.last_tick or identity != self.last_identity:
+            self.last_tick = tick
+            self.last_identity = identity
+            self.last_data = self.decode_frame(identity, result_context)
+        data = self.last_data
+        if not data:
+            return None
+
+        if process and self.last_server_ip:
+            if not connection_cache.is_connected(process, self.last_server_ip):
+                return None
+
         character = data["name"]
         map_id = data["map_id"]
         if self.last_character_name != character or self.last_map_id != map_id:
@@ -133,7 +242,15 @@ class MumbleData:
         self.last_character_name = character
         return data
 
+    def changed_since(self, tick):
+        """
+        Returns whether a new frame was decoded since the given uiTick
+        """
+        return self.last_tick != tick
+
     def get_position(self):
+        if self.zero_copy:
+            return Position(self.link.fAvatarPosition)
         self.memfile.seek(0)
         data = self.memfile.read(self.size_link)
         result = self.Unpack(Link, data)
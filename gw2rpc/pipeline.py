@@ -0,0 +1,94 @@
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+
+log = logging.getLogger()
+
+# Everything the enrichment stage needs from one MumbleLink sample, so it never touches the shared memory itself
+Frame = namedtuple("Frame", ["game", "data", "tick", "timestamp", "build_id", "position"])
+
+
+class LatestValue:
+    """
+    Bounded queue holding only the newest item, putting never blocks and replaces an unread item
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._full = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._full:
+                self.dropped += 1
+            self._item = item
+            self._full = True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """
+        Raises queue.Empty if nothing arrived within timeout seconds
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._full, timeout):
+                raise queue.Empty
+            self._full = False
+            return self._item
+
+    @property
+    def depth(self):
+        return int(self._full)
+
+
+class Stage(threading.Thread):
+    """
+    Takes the newest item from inbox, runs fn on it and puts the result into outbox
+    on_idle is called when nothing arrived within idle seconds, on_error with any exception fn raised
+    """
+    def __init__(self, name, fn, inbox, outbox=None, idle=None, on_idle=None, on_error=None):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.idle = idle
+        self.on_idle = on_idle
+        self.on_error = on_error
+        self.processed = 0
+        self.last_latency = 0
+        self.total_latency = 0
+
+    def run(self):
+        while True:
+            try:
+                item = self.inbox.get(timeout=self.idle)
+            except queue.Empty:
+                if self.on_idle:
+                    try:
+                        self.on_idle()
+                    except Exception as e:
+                        if not self.on_error:
+                            raise
+                        self.on_error(e)
+                continue
+            start = time.monotonic()
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                if not self.on_error:
+                    raise
+                self.on_error(e)
+                continue
+            self.last_latency = time.monotonic() - start
+            self.total_latency += self.last_latency
+            self.processed += 1
+            if self.outbox:
+                self.outbox.put(result)
+
+    def stats(self):
+        average = self.total_latency / self.processed if self.processed else 0
+        return (f"{self.name}: {self.processed} processed, queue depth {self.inbox.depth}, "
+                f"{self.inbox.dropped} superseded, latency {self.last_latency * 1000:.1f}ms "
+                f"(avg {average * 1000:.1f}ms)")
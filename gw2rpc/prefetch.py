@@ -0,0 +1,64 @@
+import json
+import logging
+import threading
+import time
+
+from .api import APIError, cache_key, continent_endpoint
+
+log = logging.getLogger()
+
+
+class MapPrefetcher(threading.Thread):
+    """
+    Warms the API cache in the background with all maps and their continent data
+    One request for all maps, then one request per continent floor in use, instead of two per map visit
+    """
+    def __init__(self, api):
+        super().__init__(name="MapPrefetcher", daemon=True)
+        self.api = api
+        # map_id -> (map_rect, continent_rect, number of points of interest)
+        self.table = {}
+        # Size of the JSON written to the cache, not what the responses take up in memory
+        self.bytes = 0
+        self.done = False
+
+    def store(self, items):
+        self.api.cache.put_many(items)
+        self.bytes += sum(len(json.dumps(v)) for _, v in items)
+
+    def run(self):
+        start = time.time()
+        try:
+            maps = self.api.get_all_maps()
+        except APIError as e:
+            log.error(f"Map prefetch failed with {e.code}")
+            return
+        self.store([(cache_key("maps/{}".format(m["id"])), m) for m in maps])
+
+        floors = {}
+        for m in maps:
+            if "continent_id" in m and "default_floor" in m:
+                floors.setdefault((m["continent_id"], m["default_floor"]), []).append(m)
+        # Floors holding the most maps first, they are the most likely to be visited
+        floors = sorted(floors.items(), key=lambda f: len(f[1]), reverse=True)
+        for i, ((continent_id, floor_id), members) in enumerate(floors, 1):
+            try:
+                floor = self.api.get_floor(continent_id, floor_id)
+            except APIError as e:
+                log.debug(f"Could not prefetch floor {floor_id} of continent {continent_id}: {e.code}")
+                continue
+            items = []
+            for m in members:
+                try:
+                    entry = floor["regions"][str(m["region_id"])]["maps"][str(m["id"])]
+                except KeyError:
+                    continue
+                items.append((cache_key(continent_endpoint(m)), entry))
+                self.table[m["id"]] = (entry.get("map_rect"), entry.get("continent_rect"),
+                                       len(entry.get("points_of_interest", {})))
+            self.store(items)
+            log.info(f"Prefetched floor {i}/{len(floors)}: {len(self.table)} maps, "
+                     f"{self.bytes / 1024:.0f} KiB of JSON cached")
+        self.done = True
+        log.info(f"Map prefetch done in {time.time() - start:.1f}s: {len(maps)} maps, "
+                 f"{len(self.table)} with continent data, {self.bytes / 1024:.0f} KiB of JSON cached")
@@ -0,0 +1,74 @@
+import logging
+
+import psutil
+
+log = logging.getLogger()
+
+GW2_NAMES = ("gw2-64.exe", "gw2.exe")
+RPC_NAME = "gw2rpc.exe"
+
+
+class ProcessWatcher:
+    """
+    Keeps track of running Gw2 and gw2rpc processes between ticks
+    Only PIDs not seen before are inspected, exited processes are detected by diffing the PID list
+    and checking whether the known processes are still running
+    pids and process_factory can be replaced to run against a fake process table
+    """
+    def __init__(self, pids=psutil.pids, process_factory=psutil.Process):
+        self._pids = pids
+        self._process_factory = process_factory
+        # pid -> (name, mumble_link, process), name is None when it could not be read
+        # None when not even the process could be opened
+        self.known = {}
+
+    def refresh(self):
+        current = set(self._pids())
+        for pid in self.known.keys() - current:
+            self._forget(pid)
+        # An exited process whose PID was reused is still in the PID list, and Gw2 may well
+        # get the PID of anything else. is_running compares the creation time, so the new owner
+        # is noticed and classified below
+        for pid in [p for p, e in self.known.items() if e and not e[2].is_running()]:
+            self._forget(pid)
+        for pid in current - self.known.keys():
+            try:
+                entry = self.classify(self._process_factory(pid))
+            except psutil.NoSuchProcess:
+                continue
+            except psutil.AccessDenied:
+                entry = None
+            self.known[pid] = entry
+
+    def _forget(self, pid):
+        entry = self.known.pop(pid)
+        if entry and (entry[0] in GW2_NAMES or entry[0] == RPC_NAME):
+            log.debug(f"Process exited: {entry[0]} ({pid})")
+
+    def classify(self, process):
+        try:
+            name = process.name().lower()
+        except psutil.AccessDenied:
+            return None, None, process
+        if name in GW2_NAMES:
+            try:
+                cmdline = process.cmdline()
+                mumble_link = cmdline[cmdline.index('-mumble') + 1]
+            except (ValueError, IndexError, psutil.AccessDenied):
+                mumble_link = "MumbleLink"
+            log.debug(f"Found GW2 process: {process.pid} with link {mumble_link}")
+            return name, mumble_link, process
+        return name, None, process
+
+    def _running_gw2(self):
+        # Filtered again, a process may have exited since the last refresh
+        return [e for e in self.known.values() if e and e[0] in GW2_NAMES and e[2].is_running()]
+
+    def gw2_processes(self):
+        return [e[2] for e in self._running_gw2()]
+
+    def mumble_links(self):
+        return {(e[1], e[2]) for e in self._running_gw2()}
+
+    def count(self, name):
+        return sum(1 for e in self.known.values() if e and e[0] == name)
@@ -0,0 +1,105 @@
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger()
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to capacity calls and rate calls per second on average
+    acquire() blocks until a token is available
+    """
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self._clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self._sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after threshold consecutive failed calls and rejects calls for cooldown seconds
+    After the cooldown a single trial call is let through, its outcome closes or reopens the circuit
+    """
+    def __init__(self, threshold=5, cooldown=60, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or self._clock() - self.opened_at < self.cooldown:
+                return False
+            # Half open, everyone else waits for the outcome of this call
+            self.trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial:
+                log.warning(f"GW2 API trial call failed, pausing calls for another {self.cooldown}s")
+                self.trial = False
+                self.opened_at = self._clock()
+            elif self.failures >= self.threshold and self.opened_at is None:
+                log.warning(f"GW2 API failed {self.failures} times in a row, pausing calls for {self.cooldown}s")
+                self.opened_at = self._clock()
+
+    def release(self):
+        """
+        Ends a call that says nothing about the API health, e.g. a rate limited one
+        A trial call ending this way lets the next call be the trial
+        """
+        with self._lock:
+            self.trial = False
+
+
+def backoff(attempt, base=0.5, cap=8):
+    """
+    Exponential backoff with full jitter
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def retry_after(response, cap=30):
+    """
+    Seconds to wait from a retry_after field in the JSON body, as Discord sends it, or the Retry-After header
+    At most cap, None when neither is usable
+    """
+    try:
+        return min(cap, float(response.json()["retry_after"]))
+    except (TypeError, ValueError, KeyError):
+        pass
+    try:
+        return min(cap, float(response.headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return None
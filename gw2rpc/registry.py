@@ -0,0 +1,39 @@
+from types import MappingProxyType
+
+
+class Registry:
+    """
+    The gw2rpc.info registry compiled once at load time into lookup tables keyed by map id and mount index
+    """
+    def __init__(self, data):
+        self.special = MappingProxyType(dict(data.get("special", {})))
+        self.valid = frozenset(data.get("valid", []))
+        self.regions = MappingProxyType(dict(data.get("regions", {})))
+        fractals = {}
+        for fractal in data.get("fractals", []):
+            # First entry wins, like the linear search it replaces
+            fractals.setdefault(fractal["id"], fractal)
+        self.fractals = MappingProxyType(fractals)
+        self.raids = MappingProxyType(
+            {int(k): v for k, v in data.get("raids", {}).items() if k.isdigit()})
+        self.mounts = MappingProxyType(
+            {int(k): v for k, v in data.get("mounts", {}).items() if k.isdigit()})
+        # map_id -> large image, filled on first visit as name and region come from the API
+        self._images = {}
+
+    def get_image(self, map_id, map_name, region):
+        image = self._images.get(map_id)
+        if image is None:
+            if map_name in self.special:
+                image = self.special[map_name]
+            elif str(map_id) in self.special:
+                # Many strike instances share the same ID, with this we only have to keep one asset in discord
+                image = self.special[str(map_id)]
+            elif map_id in self.valid:
+                image = map_id
+            elif region in self.regions:
+                image = self.regions[region]
+            else:
+                image = "default"
+            self._images[map_id] = image
+        return image
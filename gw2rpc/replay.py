@@ -0,0 +1,110 @@
+"""
+Record and replay GW2 API traffic, so GW2Api, MultiApi, Character and GW2RPC.get_activity
+can be exercised and benchmarked without the live API
+
+Record once against the real API:
+    GW2Api.session = RecordingSession("fixtures")
+Replay later, optionally slower and less reliable than the real thing:
+    GW2Api.session = ReplaySession("fixtures", latency=0.2, error_rate=0.1)
+
+Authenticated requests are recorded per key under a short hash of the key, so replaying
+a character with a key that does not own it answers 404 like the real API
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .api import create_session
+
+log = logging.getLogger()
+
+# Only these response headers are kept in fixtures, they are the ones GW2Api looks at
+RECORDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+# Stripped while recording, a 304 would replace the fixture body with nothing
+CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+
+def fixture_name(url, headers=None):
+    parts = urlsplit(url)
+    name = parts.path.split("/v2/", 1)[-1] + "?" + parts.query
+    name = re.sub(r"[^A-Za-z0-9-]+", "_", name).strip("_")
+    auth = (headers or {}).get("Authorization")
+    if auth:
+        name += "_key-" + hashlib.sha256(auth.encode()).hexdigest()[:8]
+    return name + ".json"
+
+
+class RecordingSession:
+    """
+    Passes requests on to a real session and writes every response to a fixture file
+    Authorization headers and keys are never written, only a short hash of them in the file name
+    """
+    def __init__(self, directory, session=None):
+        self.directory = directory
+        self.session = session or create_session()
+        self.adapters = self.session.adapters
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url, headers=None, **kwargs):
+        headers = {k: v for k, v in (headers or {}).items() if k not in CONDITIONAL_HEADERS}
+        r = self.session.get(url, headers=headers, **kwargs)
+        fixture = {
+            "status": r.status_code,
+            "headers": {h: r.headers[h] for h in RECORDED_HEADERS if h in r.headers},
+            "body": r.text
+        }
+        with open(os.path.join(self.directory, fixture_name(url, headers)), "w", encoding="utf-8") as f:
+            json.dump(fixture, f)
+        return r
+
+
+class ReplaySession:
+    """
+    Answers requests from fixture files written by RecordingSession
+    latency delays every response, error_rate is the chance of a failure drawn from errors,
+    where a status code returns that status and None raises a connection error
+    URLs without a fixture are answered with 404
+    """
+    def __init__(self, directory, latency=0, error_rate=0, errors=(500, 429, None), seed=None):
+        self.directory = directory
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = errors
+        self.adapters = {}
+        self.requests = 0
+        self._random = random.Random(seed)
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            error = self._random.choice(self.errors)
+            if error is None:
+                raise requests.exceptions.ConnectionError(f"Injected connection error for {url}")
+            return self._response(url, error, {}, '{"text": "injected error"}')
+        try:
+            with open(os.path.join(self.directory, fixture_name(url, headers)), encoding="utf-8") as f:
+                fixture = json.load(f)
+        except OSError:
+            log.debug(f"No fixture for {url}")
+            return self._response(url, 404, {}, '{"text": "no such fixture"}')
+        return self._response(url, fixture["status"], fixture["headers"], fixture["body"])
+
+    @staticmethod
+    def _response(url, status, headers, body):
+        r = requests.Response()
+        r.url = url
+        r.status_code = status
+        r.headers = CaseInsensitiveDict(headers)
+        r._content = body.encode("utf-8")
+        r.encoding = "utf-8"
+        return r
@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger()
+
+
+class Task:
+    def __init__(self, name, fn, interval):
+        self.name = name
+        self.fn = fn
+        # Seconds between runs, or a callable returning them so the cadence can adapt to the game state
+        self.interval = interval
+        self.due = 0
+        self.runs = 0
+
+    def next_interval(self):
+        return self.interval() if callable(self.interval) else self.interval
+
+
+class Scheduler:
+    """
+    Runs every task at its own cadence and sleeps until the next one is due
+    wake() makes tasks due right away, also from other threads, e.g. when an API response arrived
+    clock and wait can be replaced to drive the scheduler deterministically
+    """
+    def __init__(self, clock=time.monotonic, wait=None):
+        self.tasks = {}
+        self._clock = clock
+        self._event = threading.Event()
+        self._wait = wait or self._event.wait
+        self._lock = threading.Lock()
+        self.running = False
+
+    def add(self, name, fn, interval):
+        self.tasks[name] = Task(name, fn, interval)
+
+    def wake(self, *names):
+        """
+        Makes the named tasks, or all tasks if none are given, due immediately
+        """
+        with self._lock:
+            for task in (self.tasks[n] for n in names if n in self.tasks) if names else self.tasks.values():
+                task.due = 0
+        self._event.set()
+
+    def run_pending(self):
+        """
+        Runs all due tasks once and returns the seconds until the next one is due
+        """
+        self._event.clear()
+        for task in list(self.tasks.values()):
+            with self._lock:
+                if task.due > self._clock():
+                    continue
+                task.due = None
+            try:
+                task.fn()
+            finally:
+                task.runs += 1
+                with self._lock:
+                    # Still None unless wake() was called while the task ran, then it stays due
+                    if task.due is None:
+                        task.due = self._clock() + task.next_interval()
+        return max(0, min(t.due for t in self.tasks.values()) - self._clock())
+
+    def run(self):
+        self.running = True
+        while self.running:
+            delay = self.run_pending()
+            if delay:
+                self._wait(delay)
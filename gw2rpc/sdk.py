@@ -1,5 +1,14 @@
+import json
 import logging
-from .lib.discordsdk import *
+import time
+from collections import deque
+
+try:
+    from .lib.discordsdk import *
+    from .lib.discordsdk import exception as sdk_exception
+except OSError:
+    # No Discord SDK library for this platform, only the log and file sinks can be used
+    Discord = None
 
 from .settings import config
 
@@ -7,7 +16,28 @@ from .settings import config
 log = logging.getLogger()
 log.setLevel(config.log_level)
 
+
+def verify_length(val):
+    if len(val) > 100:
+        val = val[:97] + "..."
+    return val
+
+
+def render(a):
+    """
+    Returns the fields of an activity as set_activity passes them to Discord
+    """
+    return (verify_length(a["state"]), verify_length(a["details"]),
+            a["timestamps"]["start"] if a["timestamps"] else None,
+            a["assets"]["small_image"], verify_length(a["assets"]["small_text"]),
+            a["assets"]["large_image"], verify_length(a["assets"]["large_text"]))
+
+
 class DiscordSDK:
+    """
+    Sink publishing activities to the Discord client
+    Every sink has app (falsy while disconnected), start, close, clear, set_activity and run_callbacks
+    """
     def __init__(self, client_id) -> None:
         self.client_id = client_id
         self.start()
@@ -23,12 +53,6 @@ class DiscordSDK:
             log.debug("Discord not running.")
 
     def set_activity(self, a):
-
-        def verify_length( val):
-            if len(val) > 100:
-                val = val[:97] + "..."
-            return val
-
         self.activity.state = verify_length(a["state"])
         self.activity.details = verify_length(a["details"] )
         if a["timestamps"]:
@@ -55,9 +79,128 @@ class DiscordSDK:
         except:
             pass
 
+    def clear(self):
+        if self.app:
+            self.activity_manager.clear_activity(self.callback)
+            self.close()
+
+    def run_callbacks(self):
+        if not self.app:
+            return
+        try:
+            self.app.run_callbacks()
+        except sdk_exception.not_running:
+            # Probably a bug in the SDK library:
+            # Crashes if discord is started after RPC is already running
+            # Need to close the sdk connection and continue
+            # New sdk connection will be opened on the next presence update
+            self.close()
+
     def callback(self, result):
         if result == Result.ok:
             log.debug("Successfully set the activity!")
         else:
             pass
-            #raise Exception(result)
\ No newline at end of file
+            #raise Exception(result)
+
+class LogSink:
+    """
+    Sink writing activities to the log instead of Discord, for headless runs
+    """
+    def __init__(self):
+        self.app = None
+
+    def start(self):
+        self.app = True
+
+    def close(self):
+        self.app = None
+
+    def clear(self):
+        if self.app:
+            log.info("Activity cleared")
+            self.close()
+
+    def set_activity(self, a):
+        log.info(f"Activity: {render(a)}")
+
+    def run_callbacks(self):
+        pass
+
+
+class JsonLinesSink(LogSink):
+    """
+    Sink appending every activity as a JSON line to path, e.g. to compare runs of a load test
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def _write(self, entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def clear(self):
+        if self.app:
+            self._write({"time": time.time(), "activity": None})
+            self.close()
+
+    def set_activity(self, a):
+        self._write({"time": time.time(), "activity": render(a)})
+
+
+class ActivityPublisher:
+    """
+    Passes activities on to Discord only when they differ from the last one sent, and at most
+    updates times per window seconds. Changes over budget are held back, only the latest is sent
+    once the budget allows it
+    """
+    def __init__(self, sdk, updates=5, window=20, clock=time.monotonic):
+        self.sdk = sdk
+        self.updates = updates
+        self.window = window
+        self._clock = clock
+        self._sent_at = deque()
+        self.last_sent = None
+        self.pending = None
+        self.sent = 0
+        self.suppressed = 0
+        self.coalesced = 0
+
+    def publish(self, activity):
+        rendered = render(activity)
+        if rendered == self.last_sent:
+            # Back to what Discord already shows, anything held back is obsolete
+            if self.pending:
+                self.coalesced += 1
+            self.pending = None
+            self.suppressed += 1
+            return False
+        if self.pending and self.pending[0] != rendered:
+            self.coalesced += 1
+        self.pending = (rendered, activity)
+        return self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return False
+        now = self._clock()
+        while self._sent_at and now - self._sent_at[0] >= self.window:
+            self._sent_at.popleft()
+        if len(self._sent_at) >= self.updates:
+            return False
+        rendered, activity = self.pending
+        self.sdk.set_activity(activity)
+        self._sent_at.append(now)
+        self.last_sent = rendered
+        self.pending = None
+        self.sent += 1
+        log.debug(f"Activity sent ({self.sent} sent, {self.suppressed} suppressed, {self.coalesced} coalesced)")
+        return True
+
+    def reset(self):
+        """
+        Forget the last activity sent, e.g. after it was cleared or Discord was restarted
+        """
+        self.last_sent = None
+        self.pending = None
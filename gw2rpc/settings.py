@@ -39,7 +39,8 @@ class Config:
                 "Lang": "en",
                 "HideCommanderTag": False,
                 "HideMounts": False,
-                "LogLevel": "info"
+                "LogLevel": "info",
+                "PrefetchMaps": False
             }
             self.config["PointsOfInterest"] = {
                 "DisableInWvW": False,
@@ -70,6 +71,7 @@ class Config:
         self.display_tag = set_boolean("Settings", "DisplayGuildTag")
         self.hide_commander_tag = set_boolean("Settings", "HideCommanderTag")
         self.hide_mounts = set_boolean("Settings", "HideMounts")
+        self.prefetch_maps = set_boolean("Settings", "PrefetchMaps")
         try:
             self.lang = self.config["Settings"]["Lang"] if self.config["Settings"]["Lang"] in supported_languages else "en"
         except KeyError:
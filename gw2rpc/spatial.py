@@ -0,0 +1,37 @@
+class PointIndex:
+    """
+    2-d tree over the named points of interest of a map, answers nearest point queries in O(log n)
+    """
+    def __init__(self, points_of_interest):
+        points = [(p["coord"][0], p["coord"][1], p) for p in points_of_interest.values() if "name" in p]
+        self.size = len(points)
+        self.root = self._build(points, 0)
+
+    def _build(self, points, axis):
+        if not points:
+            return None
+        points.sort(key=lambda p: p[axis])
+        median = len(points) // 2
+        return (points[median], axis,
+                self._build(points[:median], 1 - axis),
+                self._build(points[median + 1:], 1 - axis))
+
+    def nearest(self, x, y):
+        best = [float("inf"), None]
+
+        def search(node):
+            if node is None:
+                return
+            point, axis, left, right = node
+            distance = (point[0] - x)**2 + (point[1] - y)**2
+            if distance < best[0]:
+                best[0], best[1] = distance, point[2]
+            diff = (x, y)[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            search(near)
+            # Only descend into the other half if it can hold a closer point
+            if diff * diff < best[0]:
+                search(far)
+
+        search(self.root)
+        return best[1]
@@ -0,0 +1,89 @@
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .api import create_session
+from .ratelimit import backoff, retry_after
+
+log = logging.getLogger()
+
+# The last path segment of a Discord webhook url is its secret token
+WEBHOOK_TOKEN = re.compile(r"(/webhooks/\d+/)[^/?]+")
+
+
+def redact(url):
+    return WEBHOOK_TOKEN.sub(r"\1***", url)
+
+
+class WebhookDispatcher:
+    """
+    Posts webhooks from a worker pool so presence updates never wait on them
+    Every url is delivered on its own, with retries and backoff, honouring 429 retry_after
+    Deliveries that failed for good are appended to the dead-letter file as JSON lines
+    """
+    def __init__(self, workers=4, retries=3, timeout=10, dead_letter="gw2rpc_webhooks_failed.log",
+                 session=None, sleep=time.sleep):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook")
+        self.retries = retries
+        self.timeout = timeout
+        self.dead_letter = dead_letter
+        self.session = session or create_session()
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+
+    def send(self, urls, data):
+        """
+        Queues data for every url and returns the futures, each resolving to True once delivered
+        """
+        return [self.executor.submit(self._deliver, url, data) for url in urls]
+
+    def _deliver(self, url, data):
+        error = None
+        wait = 0
+        for attempt in range(self.retries + 1):
+            if attempt:
+                log.debug(f"Retrying webhook {redact(url)} in {wait:.1f}s ({attempt}/{self.retries})")
+                self._sleep(wait)
+            try:
+                r = self.session.post(url, json=data, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                error = type(e).__name__
+                wait = backoff(attempt)
+                continue
+            if r.status_code < 400:
+                with self._lock:
+                    self.delivered += 1
+                return True
+            error = f"HTTP {r.status_code}"
+            if r.status_code == 429:
+                wait = retry_after(r) or backoff(attempt)
+            elif r.status_code >= 500:
+                wait = backoff(attempt)
+            else:
+                # Invalid or deleted webhook, retrying will not help
+                break
+        log.error(f"Webhook {redact(url)} failed: {error}")
+        self._dead_letter(url, data, error)
+        return False
+
+    def _dead_letter(self, url, data, error):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "url": redact(url),
+            "error": error,
+            "data": data
+        }
+        with self._lock:
+            self.failed += 1
+            try:
+                with open(self.dead_letter, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                log.error(f"Could not write webhook dead letter: {e}")
@@ -1,23 +1,56 @@
+import argparse
 import logging
 import logging.handlers
 
+from gw2rpc.api import GW2Api
 from gw2rpc.gw2rpc import GW2RPC
+from gw2rpc.headless import FramePlayer, MumbleLinkWriter, load_frames, simulated_processes
+from gw2rpc.replay import ReplaySession
+from gw2rpc.sdk import JsonLinesSink, LogSink
 from gw2rpc.settings import config
 
-def setup_logging():
+def setup_logging(headless=False):
     formatter = logging.Formatter(
         '%(asctime)s:%(levelname)s:%(name)s: %(message)s')
     handler = logging.handlers.RotatingFileHandler(
         filename="gw2rpc.log", maxBytes=5 * 1024 * 1024, encoding='utf-8')
     handler.setFormatter(formatter)
-    #    stderr_hdlr = logging.StreamHandler()
     logger = logging.getLogger("")
     logger.setLevel(config.log_level)
-    #    logger.addHandler(stderr_hdlr)
     logger.addHandler(handler)
+    if headless:
+        stderr_hdlr = logging.StreamHandler()
+        stderr_hdlr.setFormatter(formatter)
+        logger.addHandler(stderr_hdlr)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Guild Wars 2 Rich Presence for Discord")
+    parser.add_argument("--headless", action="store_true",
+                        help="run without systray and message boxes, e.g. on a server or for profiling")
+    parser.add_argument("--output", metavar="FILE",
+                        help="in headless mode, append activities as JSON lines to FILE instead of logging them")
+    parser.add_argument("--frames", metavar="FILE",
+                        help="in headless mode, play the MumbleLink frames in FILE instead of reading the game")
+    parser.add_argument("--frame-interval", metavar="SECONDS", type=float, default=1,
+                        help="seconds between two played frames")
+    parser.add_argument("--api-fixtures", metavar="DIR",
+                        help="answer GW2 API requests from fixtures recorded into DIR instead of the live API")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    setup_logging()
-    rpc = GW2RPC()
+    args = parse_args()
+    setup_logging(args.headless)
+    if args.api_fixtures:
+        GW2Api.session = ReplaySession(args.api_fixtures)
+    if args.headless:
+        sink = JsonLinesSink(args.output) if args.output else LogSink()
+        processes = None
+        if args.frames:
+            FramePlayer(MumbleLinkWriter(), load_frames(args.frames), interval=args.frame_interval).start()
+            processes = simulated_processes(["MumbleLink"])
+        rpc = GW2RPC(headless=True, sink=sink, processes=processes)
+    else:
+        rpc = GW2RPC()
     rpc.main_loop()
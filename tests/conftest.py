@@ -0,0 +1,127 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The gw2rpc package is run from the project root, not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gw2rpc.api import GW2Api, SingleFlight, create_session  # noqa: E402
+from gw2rpc.cache import NegativeCache  # noqa: E402
+from gw2rpc.ratelimit import CircuitBreaker, TokenBucket  # noqa: E402
+
+
+class FakeClock:
+    """
+    Time that only moves when sleep() or wait() is called
+    """
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    wait = sleep
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Local HTTP server answering every request with respond(method, path, headers, body) -> (status, headers, body)
+    All requests are recorded as (method, path, body), connections counts accepted TCP connections
+    """
+    daemon_threads = True
+
+    def __init__(self, respond):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.respond = respond
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/"
+
+    def count(self, path_prefix="/"):
+        with self.lock:
+            return sum(1 for r in self.requests if r[1].startswith(path_prefix))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def handle_request(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        with self.server.lock:
+            self.server.requests.append((method, self.path, body))
+        status, headers, content = self.server.respond(method, self.path, self.headers, body)
+        content = content.encode() if isinstance(content, str) else content
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    servers = []
+
+    def start(respond):
+        server = StubServer(respond)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def fresh_api_state(monkeypatch, clock):
+    """
+    Gives the class level GW2Api state shared by all clients a fresh start:
+    no rate limit, a breaker and negative cache on the fake clock, no calls in flight and a new session
+    """
+    monkeypatch.setattr(GW2Api, "limiter", TokenBucket(1000, 1000))
+    monkeypatch.setattr(GW2Api, "breaker", CircuitBreaker(clock=clock))
+    monkeypatch.setattr(GW2Api, "failures", NegativeCache(clock=clock))
+    monkeypatch.setattr(GW2Api, "flights", SingleFlight())
+    monkeypatch.setattr(GW2Api, "session", create_session())
+
+
+@pytest.fixture
+def api_workdir(fresh_api_state, monkeypatch, tmp_path):
+    """
+    fresh_api_state in a temporary working directory, where MultiApi keeps its caches
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,56 @@
+import pytest
+import requests
+
+from gw2rpc.api import GW2Api
+
+
+class ETagSession:
+    """
+    Answers with an ETag and a 304 whenever the client sends it back
+    """
+    def __init__(self, body='{"name": "Some Char"}'):
+        self.body = body
+        self.conditional = 0
+
+    def get(self, url, headers=None, timeout=None):
+        r = requests.Response()
+        r.headers["ETag"] = '"v1"'
+        if headers.get("If-None-Match") == '"v1"':
+            self.conditional += 1
+            r.status_code = 304
+            r._content = b""
+        else:
+            r.status_code = 200
+            r._content = self.body.encode()
+        return r
+
+
+@pytest.fixture
+def api(fresh_api_state):
+    client = GW2Api()
+    client._authenticated = True
+    client.session = ETagSession()
+    return client
+
+
+def test_character_refresh_uses_the_stored_body(api):
+    first = api.get_character("Some Char")
+    assert api.get_character("Some Char") == first
+    assert api.session.conditional == 1
+    assert api.bytes_saved == len(api.session.body)
+
+
+def test_maps_and_bulk_endpoints_are_not_kept(api):
+    api.get_map_info(15)
+    api.get_map_info(15)
+    api.get_all_maps()
+    assert api.session.conditional == 0
+    assert not api._validators
+
+
+def test_stored_bodies_are_bounded_by_size(api, monkeypatch):
+    monkeypatch.setattr(GW2Api, "max_validator_bytes", 3 * len(api.session.body))
+    for i in range(10):
+        api.get_character(f"Char {i}")
+    assert len(api._validators) == 3
+    assert api._validator_bytes == 3 * len(api.session.body)
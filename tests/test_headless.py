@@ -0,0 +1,68 @@
+import pytest
+
+from gw2rpc.headless import FramePlayer, MumbleLinkWriter, simulated_processes
+from gw2rpc.mumble import MumbleData
+
+FRAME = {
+    "identity": {"name": "Some Char", "profession": 1, "spec": 0, "race": 0, "map_id": 15,
+                 "world_id": 1001, "team_color_id": 0, "commander": False, "fov": 0.9, "uisz": 1},
+    "position": [10, 2, 20],
+    "build_id": 150000,
+    "ui_state": 0b1001000,
+    "mount_index": 3
+}
+
+
+@pytest.fixture(autouse=True)
+def link_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr("gw2rpc.mumble.LINK_DIR", str(tmp_path))
+
+
+@pytest.fixture
+def writer():
+    w = MumbleLinkWriter("TestLink")
+    yield w
+    w.close()
+
+
+def test_written_frames_are_read_back(writer):
+    game = MumbleData("TestLink")
+    game.create_map()
+    assert game.get_mumble_data() is None
+    writer.write(FRAME)
+    data = game.get_mumble_data()
+    assert data["name"] == "Some Char" and data["map_id"] == 15
+    assert data["mount_index"] == 3 and data["in_combat"]
+    assert game.in_focus and game.build_id == 150000
+    assert game.get_position().z == 2
+    game.close_map()
+
+
+def test_every_frame_bumps_the_tick(writer):
+    game = MumbleData("TestLink")
+    game.create_map()
+    writer.write(FRAME)
+    game.get_mumble_data()
+    tick = game.last_tick
+    game.get_mumble_data()
+    assert not game.changed_since(tick)
+    writer.write(FRAME)
+    game.get_mumble_data()
+    assert game.changed_since(tick)
+    game.close_map()
+
+
+def test_player_writes_all_frames(writer):
+    player = FramePlayer(writer, [FRAME] * 3, interval=0, loop=False)
+    player.start()
+    player.join(5)
+    assert player.played == 3
+    assert writer.link.link.uiTick == 3
+
+
+def test_simulated_processes_are_found_with_their_links():
+    watcher = simulated_processes(["MumbleLink", "Alt"])
+    watcher.refresh()
+    links = {link for link, _ in watcher.mumble_links()}
+    assert links == {"MumbleLink", "Alt"}
+    assert all(p.connections() == [] for p in watcher.gw2_processes())
@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds importing the modules below may take, they used to verify every API key over the network
+# gw2rpc.gw2rpc also loads the locales, which fall back to English without the compiled .mo files
+IMPORT_BUDGET = 1.0
+
+# Runs in a fresh interpreter with all network access failing loudly
+SCRIPT = """
+import json, socket, sys, time
+attempts = []
+def blocked(*args, **kwargs):
+    attempts.append(repr(args[:2]))
+    raise OSError("network access during import")
+socket.socket.connect = blocked
+socket.getaddrinfo = blocked
+start = time.perf_counter()
+import gw2rpc.api
+import gw2rpc.character
+import gw2rpc.prefetch
+import gw2rpc.gw2rpc
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "attempts": attempts, "client": gw2rpc.api._api is not None}))
+"""
+
+
+def test_import_makes_no_network_calls_and_stays_in_budget(tmp_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT] + sys.path))
+    # config.ini and the caches are looked up in the working directory
+    out = subprocess.run([sys.executable, "-c", SCRIPT], cwd=tmp_path, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    result = json.loads(out.splitlines()[-1])
+    assert result["attempts"] == []
+    assert not result["client"]
+    assert result["elapsed"] < IMPORT_BUDGET
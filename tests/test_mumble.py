@@ -0,0 +1,78 @@
+import pytest
+
+from gw2rpc.headless import MumbleLinkWriter
+from gw2rpc.mumble import ConnectionCache, MumbleData
+
+FRAME = {
+    "identity": {"name": "Some Char", "profession": 4, "spec": 0, "race": 2, "map_id": 1452,
+                 "world_id": 2004, "team_color_id": 0, "commander": True, "fov": 0.9, "uisz": 1},
+    "position": [-120.5, 30.25, 512.0],
+    "build_id": 150000,
+    "ui_state": 0b1000,
+    "mount_index": 5
+}
+
+
+@pytest.fixture(autouse=True)
+def link_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr("gw2rpc.mumble.LINK_DIR", str(tmp_path))
+
+
+def read(zero_copy):
+    game = MumbleData("TestLink", zero_copy=zero_copy)
+    game.create_map()
+    data, position = game.get_mumble_data(), game.get_position()
+    game.close_map()
+    return data, (position.x, position.y, position.z), game
+
+
+def test_zero_copy_reads_the_same_as_copying():
+    writer = MumbleLinkWriter("TestLink")
+    writer.write(FRAME)
+    assert read(zero_copy=True)[:2] == read(zero_copy=False)[:2]
+    writer.close()
+
+
+def test_closing_releases_the_structures():
+    writer = MumbleLinkWriter("TestLink")
+    writer.write(FRAME)
+    _, _, game = read(zero_copy=True)
+    assert game.memfile is None and game.link is None
+    writer.close()
+
+
+class Process:
+    pid = 1
+
+    def __init__(self, connections):
+        self._connections = connections
+        self.scans = 0
+
+    def connections(self):
+        self.scans += 1
+        if isinstance(self._connections, Exception):
+            raise self._connections
+        return self._connections
+
+
+class Connection:
+    status = "ESTABLISHED"
+
+    def __init__(self, ip):
+        self.raddr = type("Address", (), {"ip": ip})
+
+
+def test_connection_checks_are_cached_per_server():
+    cache = ConnectionCache(ttl=60)
+    process = Process([Connection("1.2.3.4")])
+    assert all(cache.is_connected(process, "1.2.3.4") for _ in range(10))
+    assert process.scans == 1 and cache.saved == 9
+    assert not cache.is_connected(process, "5.6.7.8")
+    assert process.scans == 2
+
+
+def test_denied_connection_checks_are_cached():
+    cache = ConnectionCache(ttl=60)
+    process = Process(PermissionError())
+    assert all(cache.is_connected(process, "1.2.3.4") for _ in range(10))
+    assert process.scans == 1
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from gw2rpc.api import MultiApi, cache_key, continent_endpoint
+from gw2rpc.prefetch import MapPrefetcher
+
+QUEENSDALE = {"id": 15, "name": "Queensdale", "continent_id": 1, "default_floor": 1, "region_id": 4}
+# Not on the floor the API returns
+KESSEX_HILLS = {"id": 23, "name": "Kessex Hills", "continent_id": 1, "default_floor": 1, "region_id": 4}
+UNKNOWN_REGION = {"id": 24, "name": "Gendarran Fields", "continent_id": 1, "default_floor": 1, "region_id": 99}
+# No continent data at all, e.g. instances
+NO_CONTINENT = {"id": 1000, "name": "Instance"}
+
+QUEENSDALE_FLOOR = {"name": "Queensdale", "map_rect": [[-43008, -27648], [43008, 30720]],
+                    "continent_rect": [[42624, 28032], [46208, 30464]],
+                    "points_of_interest": {"1": {"name": "Shaemoor", "coord": [43000, 29000]}}}
+FLOOR = {"regions": {"4": {"name": "Kryta", "maps": {"15": QUEENSDALE_FLOOR}}}}
+
+
+def gw2_api(method, path, headers, body):
+    path = path.split("&lang=")[0].split("?lang=")[0]
+    if path == "/maps?ids=all":
+        return 200, {}, json.dumps([QUEENSDALE, KESSEX_HILLS, UNKNOWN_REGION, NO_CONTINENT])
+    if path == "/continents/1/floors/1":
+        return 200, {}, json.dumps(FLOOR)
+    return 404, {}, '{"text": "no such id"}'
+
+
+pytestmark = pytest.mark.usefixtures("api_workdir")
+
+
+def test_prefetched_maps_are_served_from_the_cache(stub_server):
+    server = stub_server(gw2_api)
+    api = MultiApi([], base_url=server.url)
+    prefetcher = MapPrefetcher(api)
+    prefetcher.run()
+    assert prefetcher.done
+    assert server.count() == 2
+    assert api.get_map_info(15) == QUEENSDALE
+    assert api.get_continent_info(QUEENSDALE) == QUEENSDALE_FLOOR
+    assert api.get_map_info(23) == KESSEX_HILLS
+    assert api.get_map_info(1000) == NO_CONTINENT
+    assert server.count() == 2
+
+
+def test_maps_missing_from_their_floor_are_skipped(stub_server):
+    server = stub_server(gw2_api)
+    api = MultiApi([], base_url=server.url)
+    prefetcher = MapPrefetcher(api)
+    prefetcher.run()
+    assert set(prefetcher.table) == {15}
+    assert prefetcher.table[15][2] == 1
+    for m in (KESSEX_HILLS, UNKNOWN_REGION):
+        assert api.cache.get(cache_key(continent_endpoint(m))) is None
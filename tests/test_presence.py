@@ -0,0 +1,125 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from gw2rpc.api import BASE_URL, GW2Api, MultiApi, set_api
+from gw2rpc.gw2rpc import GW2RPC
+from gw2rpc.headless import MumbleLinkWriter, simulated_processes
+from gw2rpc.replay import ReplaySession, fixture_name
+from gw2rpc.sdk import JsonLinesSink
+from gw2rpc.settings import config
+
+FRAME = {
+    "identity": {"name": "Some Char", "profession": 1, "spec": 0, "race": 0, "map_id": 15,
+                 "world_id": 1001, "team_color_id": 0, "commander": False, "fov": 0.9, "uisz": 1},
+    "position": [10, 2, 20],
+    "build_id": 150000
+}
+
+QUEENSDALE = {"id": 15, "name": "Queensdale", "min_level": 1, "max_level": 17, "default_floor": 1,
+              "type": "Public", "floors": [0, 1], "region_id": 4, "region_name": "Kryta",
+              "continent_id": 1, "continent_name": "Tyria",
+              "map_rect": [[-43008, -27648], [43008, 30720]],
+              "continent_rect": [[42624, 28032], [46208, 30464]]}
+
+
+def write_fixture(directory, endpoint, body):
+    url = BASE_URL + endpoint + "?lang=" + config.lang
+    with open(directory / fixture_name(url), "w", encoding="utf-8") as f:
+        json.dump({"status": 200, "headers": {"Content-Type": "application/json"}, "body": json.dumps(body)}, f)
+
+
+def refuse(*args, **kwargs):
+    raise requests.exceptions.ConnectionError("gw2rpc.info is not reachable in tests")
+
+
+@pytest.fixture
+def headless(api_workdir, monkeypatch):
+    """
+    Builds a headless GW2RPC for a sink, playing a simulated game against replayed API fixtures
+    """
+    fixtures = api_workdir / "fixtures"
+    fixtures.mkdir()
+    write_fixture(fixtures, "maps/15", QUEENSDALE)
+    monkeypatch.setattr(GW2Api, "session", ReplaySession(str(fixtures)))
+    monkeypatch.setattr("gw2rpc.mumble.LINK_DIR", str(api_workdir))
+    monkeypatch.setattr("gw2rpc.gw2rpc.requests.get", refuse)
+    monkeypatch.setattr(config, "prefetch_maps", False)
+    crashes = []
+    monkeypatch.setattr(GW2RPC, "crash", lambda self, e: crashes.append(e))
+    monkeypatch.setattr(GW2RPC, "shutdown", lambda self: None)
+    writer = MumbleLinkWriter("MumbleLink")
+    writer.write(FRAME)
+    api = MultiApi([])
+    set_api(api)
+
+    def create(sink):
+        return GW2RPC(headless=True, sink=sink, processes=simulated_processes(["MumbleLink"]), api=api)
+
+    yield create, crashes
+    set_api(None)
+    writer.close()
+
+
+def run_until(rpc, done, timeout=10):
+    thread = threading.Thread(target=rpc.main_loop, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while not done() and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        rpc.scheduler.running = False
+        rpc.scheduler.wake("presence")
+    thread.join(5)
+    return done()
+
+
+def test_headless_run_publishes_the_map(headless, tmp_path):
+    create, crashes = headless
+    output = tmp_path / "activities.jsonl"
+    rpc = create(JsonLinesSink(str(output)))
+
+    def published():
+        return output.exists() and "in Queensdale" in output.read_text(encoding="utf-8")
+
+    assert run_until(rpc, published)
+    state, details = json.loads(output.read_text(encoding="utf-8").splitlines()[-1])["activity"][:2]
+    assert state == "in Queensdale" and details == "Some Char"
+    assert crashes == []
+
+
+class BrokenPipeSink(JsonLinesSink):
+    """
+    Loses its connection on the first callback after the first activity, like a restarted Discord client
+    """
+    def __init__(self, path):
+        super().__init__(path)
+        self.starts = 0
+        self.broken = False
+
+    def start(self):
+        super().start()
+        self.starts += 1
+
+    def run_callbacks(self):
+        if not self.broken:
+            self.broken = True
+            raise BrokenPipeError
+
+
+def test_broken_pipe_reconnects_instead_of_crashing(headless, tmp_path):
+    create, crashes = headless
+    output = tmp_path / "activities.jsonl"
+    sink = BrokenPipeSink(str(output))
+    rpc = create(sink)
+
+    def republished():
+        return output.exists() and len(output.read_text(encoding="utf-8").splitlines()) >= 2
+
+    assert run_until(rpc, republished)
+    assert sink.starts == 2
+    assert crashes == []
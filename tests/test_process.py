@@ -0,0 +1,126 @@
+import psutil
+
+from gw2rpc.process import ProcessWatcher
+
+
+class FakeProcess:
+    def __init__(self, pid, name, cmdline=()):
+        self.pid = pid
+        self._name = name
+        self._cmdline = list(cmdline)
+        self.running = True
+        self.cmdline_reads = 0
+
+    def name(self):
+        return self._name
+
+    def cmdline(self):
+        self.cmdline_reads += 1
+        return self._cmdline
+
+    def is_running(self):
+        return self.running
+
+
+class FakeTable:
+    def __init__(self, *processes):
+        self.processes = {p.pid: p for p in processes}
+        self.lookups = 0
+
+    def pids(self):
+        return list(self.processes)
+
+    def process(self, pid):
+        self.lookups += 1
+        try:
+            return self.processes[pid]
+        except KeyError:
+            raise psutil.NoSuchProcess(pid)
+
+    def watcher(self):
+        return ProcessWatcher(pids=self.pids, process_factory=self.process)
+
+
+def test_finds_gw2_and_its_mumble_link():
+    gw2 = FakeProcess(10, "Gw2-64.exe", ["Gw2-64.exe", "-mumble", "Alt"])
+    table = FakeTable(gw2, FakeProcess(11, "explorer.exe"), FakeProcess(12, "gw2rpc.exe"))
+    watcher = table.watcher()
+    watcher.refresh()
+    assert watcher.gw2_processes() == [gw2]
+    assert watcher.mumble_links() == {("Alt", gw2)}
+    assert watcher.count("gw2rpc.exe") == 1
+
+
+def test_default_mumble_link():
+    gw2 = FakeProcess(10, "gw2-64.exe", ["gw2-64.exe"])
+    watcher = FakeTable(gw2).watcher()
+    watcher.refresh()
+    assert watcher.mumble_links() == {("MumbleLink", gw2)}
+
+
+def test_only_new_pids_are_inspected():
+    gw2 = FakeProcess(10, "Gw2-64.exe")
+    table = FakeTable(gw2, *(FakeProcess(pid, "other.exe") for pid in range(100, 600)))
+    watcher = table.watcher()
+    watcher.refresh()
+    assert table.lookups == 501
+    for _ in range(5):
+        watcher.refresh()
+    assert table.lookups == 501
+    assert gw2.cmdline_reads == 1
+    table.processes[700] = FakeProcess(700, "other.exe")
+    watcher.refresh()
+    assert table.lookups == 502
+
+
+def test_exited_process_is_dropped():
+    gw2 = FakeProcess(10, "Gw2-64.exe")
+    table = FakeTable(gw2)
+    watcher = table.watcher()
+    watcher.refresh()
+    del table.processes[10]
+    watcher.refresh()
+    assert watcher.gw2_processes() == []
+    assert watcher.mumble_links() == set()
+
+
+def test_reused_pid_is_reclassified():
+    gw2 = FakeProcess(10, "Gw2-64.exe")
+    table = FakeTable(gw2)
+    watcher = table.watcher()
+    watcher.refresh()
+    # Gw2 exited and another program got its PID before the next refresh
+    gw2.running = False
+    assert watcher.gw2_processes() == []
+    table.processes[10] = FakeProcess(10, "notepad.exe")
+    watcher.refresh()
+    assert watcher.gw2_processes() == []
+    assert watcher.known[10][0] == "notepad.exe"
+
+
+def test_gw2_on_a_reused_pid_is_found():
+    notepad = FakeProcess(10, "notepad.exe")
+    table = FakeTable(notepad)
+    watcher = table.watcher()
+    watcher.refresh()
+    assert watcher.gw2_processes() == []
+    # Notepad exited and Gw2 got its PID before the next refresh
+    notepad.running = False
+    gw2 = FakeProcess(10, "Gw2-64.exe", ["Gw2-64.exe", "-mumble", "Alt"])
+    table.processes[10] = gw2
+    watcher.refresh()
+    assert watcher.gw2_processes() == [gw2]
+    assert watcher.mumble_links() == {("Alt", gw2)}
+
+
+def test_access_denied_is_remembered():
+    class Denied(FakeProcess):
+        def name(self):
+            raise psutil.AccessDenied(self.pid)
+
+    table = FakeTable(Denied(5, "system"))
+    watcher = table.watcher()
+    watcher.refresh()
+    watcher.refresh()
+    assert table.lookups == 1
+    assert watcher.gw2_processes() == []
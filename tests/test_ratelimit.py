@@ -0,0 +1,113 @@
+import pytest
+import requests
+
+from gw2rpc.api import APIError, GW2Api
+from gw2rpc.ratelimit import CircuitBreaker, TokenBucket, retry_after
+
+
+def response(status, body="{}", headers=None):
+    r = requests.Response()
+    r.status_code = status
+    r._content = body.encode()
+    r.headers.update(headers or {})
+    return r
+
+
+class StubSession:
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def get(self, url, headers=None, timeout=None):
+        self.calls += 1
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        if status is None:
+            raise requests.exceptions.ConnectionError(url)
+        return response(status, headers={"Retry-After": "1"} if status == 429 else None)
+
+
+@pytest.fixture
+def api(fresh_api_state, monkeypatch, clock):
+    monkeypatch.setattr(GW2Api, "breaker", CircuitBreaker(threshold=3, cooldown=60, clock=clock))
+    monkeypatch.setattr("gw2rpc.api.time.sleep", lambda s: None)
+    return GW2Api()
+
+
+def test_token_bucket_limits_rate(clock):
+    bucket = TokenBucket(rate=4, capacity=2, clock=clock, sleep=clock.sleep)
+    for _ in range(12):
+        bucket.acquire()
+    # 2 from the burst, the other 10 at 4 per second
+    assert clock.now == pytest.approx(2.5)
+
+
+def test_breaker_lets_a_single_trial_through(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=60, clock=clock)
+    breaker.failure()
+    breaker.failure()
+    assert not breaker.allow()
+    clock.now = 60
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.failure()
+    assert not breaker.allow()
+    clock.now = 120
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.allow() and breaker.allow()
+
+
+def test_released_trial_passes_the_trial_on(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=60, clock=clock)
+    breaker.failure()
+    clock.now = 60
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_retry_after_prefers_the_body_and_is_capped():
+    assert retry_after(response(429, '{"retry_after": 0.25}', {"Retry-After": "2"})) == 0.25
+    assert retry_after(response(429, '{"text": "too many requests"}', {"Retry-After": "2"})) == 2
+    assert retry_after(response(429, "not json", {"Retry-After": "2"})) == 2
+    assert retry_after(response(429, '{"retry_after": 3600}')) == 30
+    assert retry_after(response(429, "[]")) is None
+
+
+def test_one_failure_per_call_after_retries(api):
+    api.session = StubSession(500)
+    with pytest.raises(APIError):
+        api.get_map_info(1)
+    assert api.session.calls == GW2Api.retries + 1
+    assert api.breaker.failures == 1
+    with pytest.raises(APIError):
+        api.get_map_info(2)
+    assert api.breaker.opened_at is None
+
+
+def test_connection_errors_count_once_per_call(api):
+    api.session = StubSession(None)
+    for map_id in range(3):
+        with pytest.raises(APIError):
+            api.get_map_info(map_id)
+    assert api.breaker.failures == 3
+    assert api.breaker.opened_at is not None
+    with pytest.raises(APIError):
+        api.get_map_info(5)
+    assert api.session.calls == 3 * (GW2Api.retries + 1)
+
+
+def test_rate_limiting_is_not_an_outage(api):
+    api.session = StubSession(429)
+    for map_id in range(5):
+        with pytest.raises(APIError) as e:
+            api.get_map_info(map_id)
+        assert e.value.code == 429
+    assert api.breaker.failures == 0
+    assert api.breaker.opened_at is None
+
+
+def test_success_after_retry_closes(api):
+    api.session = StubSession(503, 200)
+    assert api.get_map_info(1) == {}
+    assert api.breaker.failures == 0
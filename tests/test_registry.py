@@ -0,0 +1,35 @@
+import pytest
+
+from gw2rpc.registry import Registry
+
+DATA = {
+    "special": {"Eye of the North": "eotn", "1370": "strike"},
+    "valid": [15, 18],
+    "regions": {"Kryta": "kryta"},
+    "fractals": [{"id": 872, "name": "Mistlock Observatory"}, {"id": 872, "name": "Duplicate"}],
+    "raids": {"1062": {"name": "Spirit Vale"}, "not a map": {}},
+    "mounts": {"1": "Jackal", "x": "ignored"}
+}
+
+
+def test_tables_are_keyed_by_id():
+    registry = Registry(DATA)
+    assert registry.fractals[872]["name"] == "Mistlock Observatory"
+    assert registry.raids[1062]["name"] == "Spirit Vale"
+    assert list(registry.raids) == [1062]
+    assert registry.mounts == {1: "Jackal"}
+
+
+def test_image_lookup_order():
+    registry = Registry(DATA)
+    assert registry.get_image(1, "Eye of the North", "Tarir") == "eotn"
+    assert registry.get_image(1370, "Some Strike", "Tarir") == "strike"
+    assert registry.get_image(15, "Queensdale", "Kryta") == 15
+    assert registry.get_image(20, "Blazeridge Steppes", "Kryta") == "kryta"
+    assert registry.get_image(9999, "Unknown", "Nowhere") == "default"
+
+
+def test_tables_are_read_only():
+    registry = Registry(DATA)
+    with pytest.raises(TypeError):
+        registry.fractals[1] = {}
@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+from gw2rpc.api import APIError, GW2Api, MultiApi, create_session
+from gw2rpc.cache import NegativeCache
+from gw2rpc.replay import RecordingSession, ReplaySession
+
+ACCOUNTS = {
+    "Bearer key-a": {"name": "Account A", "characters": ["Alpha"]},
+    "Bearer key-b": {"name": "Account B", "characters": ["Beta"]},
+}
+
+
+def gw2_stub(method, path, headers, body):
+    """
+    Just enough of the GW2 API for two keys, each owning one character
+    """
+    path = path.split("?")[0].split("/v2/", 1)[1]
+    account = ACCOUNTS.get(headers.get("Authorization"))
+    if path == "guild/abc":
+        if headers.get("If-None-Match") == '"v1"':
+            return 304, {}, ""
+        return 200, {"ETag": '"v1"'}, '{"id": "abc", "tag": "TAG"}'
+    if not account:
+        return 401, {}, '{"text": "Invalid access token"}'
+    if path == "tokeninfo":
+        return 200, {}, json.dumps({"permissions": ["account", "characters", "builds"]})
+    if path == "account":
+        return 200, {}, json.dumps({"name": account["name"], "world": 1001})
+    if path == "worlds/1001":
+        return 200, {}, '{"name": "Anvil Rock"}'
+    if path == "characters":
+        return 200, {}, json.dumps(account["characters"])
+    if path.startswith("characters/") and path.split("/")[1] in account["characters"]:
+        return 200, {}, json.dumps({"name": path.split("/")[1]})
+    return 404, {}, '{"text": "no such character"}'
+
+
+pytestmark = pytest.mark.usefixtures("api_workdir")
+
+
+def use(monkeypatch, session):
+    monkeypatch.setattr(GW2Api, "session", session)
+    monkeypatch.setattr(GW2Api, "failures", NegativeCache())
+
+
+def test_revalidated_responses_keep_their_fixture(monkeypatch, tmp_path, stub_server):
+    server = stub_server(gw2_stub)
+    use(monkeypatch, RecordingSession(tmp_path / "fixtures", create_session()))
+    api = GW2Api(base_url=server.url + "v2/")
+    api.get_guild("abc")
+    # Would be a conditional request answered with 304 without the recorder stripping it
+    api.get_guild("abc")
+    assert all("If-None-Match" not in str(r) for r in server.requests)
+
+    use(monkeypatch, ReplaySession(tmp_path / "fixtures"))
+    assert GW2Api(base_url=server.url + "v2/").get_guild("abc") == {"id": "abc", "tag": "TAG"}
+
+
+def test_replayed_characters_belong_to_their_key(monkeypatch, tmp_path, stub_server):
+    server = stub_server(gw2_stub)
+    base_url = server.url + "v2/"
+    use(monkeypatch, RecordingSession(tmp_path / "fixtures", create_session()))
+    api = MultiApi(["key-a", "key-b"], base_url=base_url)
+    assert api.get_character("Alpha") == {"name": "Alpha"}
+    assert api.get_character("Beta") == {"name": "Beta"}
+    for name in os.listdir(tmp_path / "fixtures"):
+        text = (tmp_path / "fixtures" / name).read_text()
+        assert "key-a" not in text and "key-b" not in text and "Bearer" not in name
+
+    use(monkeypatch, ReplaySession(tmp_path / "fixtures"))
+    key_b = GW2Api("key-b", base_url=base_url)
+    assert key_b.get_character("Beta") == {"name": "Beta"}
+    with pytest.raises(APIError) as e:
+        key_b.get_character("Alpha")
+    assert e.value.code == 404
+
+    api = MultiApi(["key-a", "key-b"], base_url=base_url)
+    assert api.get_character("Beta") == {"name": "Beta"}
+    assert api.account == "Account B"
@@ -0,0 +1,87 @@
+import threading
+
+from gw2rpc.scheduler import Scheduler
+
+
+def run_for(scheduler, clock, seconds):
+    while True:
+        delay = scheduler.run_pending()
+        if clock.now + delay > seconds:
+            return
+        clock.wait(delay)
+
+
+def test_tasks_run_at_their_own_cadence(clock):
+    scheduler = Scheduler(clock=clock, wait=clock.wait)
+    runs = {"fast": [], "slow": []}
+    scheduler.add("fast", lambda: runs["fast"].append(clock.now), 0.5)
+    scheduler.add("slow", lambda: runs["slow"].append(clock.now), 5)
+    run_for(scheduler, clock, 10)
+    assert runs["fast"] == [i / 2 for i in range(21)]
+    assert runs["slow"] == [0, 5, 10]
+
+
+def test_interval_adapts_to_state(clock):
+    scheduler = Scheduler(clock=clock, wait=clock.wait)
+    state = {"in_game": False}
+    runs = []
+    scheduler.add("presence", lambda: runs.append(clock.now), lambda: 1 / 2 if state["in_game"] else 5)
+    run_for(scheduler, clock, 10)
+    assert runs == [0, 5, 10]
+    # The next interval is taken when a run finished, so the change shows after the run at 15
+    state["in_game"] = True
+    run_for(scheduler, clock, 17)
+    assert runs[3:] == [15, 15.5, 16, 16.5, 17]
+
+
+def test_returns_delay_until_next_task(clock):
+    scheduler = Scheduler(clock=clock, wait=clock.wait)
+    scheduler.add("a", lambda: None, 2)
+    scheduler.add("b", lambda: None, 3)
+    assert scheduler.run_pending() == 2
+    clock.now = 1.5
+    assert scheduler.run_pending() == 0.5
+
+
+def test_wake_makes_a_task_due_immediately(clock):
+    scheduler = Scheduler(clock=clock, wait=clock.wait)
+    runs = []
+    scheduler.add("presence", lambda: runs.append(clock.now), 5)
+    scheduler.add("processes", lambda: None, 1)
+    scheduler.run_pending()
+    clock.now = 1
+    scheduler.wake("presence", "unknown")
+    scheduler.run_pending()
+    assert runs == [0, 1]
+
+
+def test_wake_while_running_runs_the_task_again(clock):
+    scheduler = Scheduler(clock=clock, wait=clock.wait)
+    runs = []
+
+    def task():
+        runs.append(clock.now)
+        if len(runs) == 1:
+            scheduler.wake("task")
+
+    scheduler.add("task", task, 5)
+    assert scheduler.run_pending() == 0
+    scheduler.run_pending()
+    assert runs == [0, 0]
+    assert scheduler.run_pending() == 5
+
+
+def test_wake_from_another_thread_interrupts_the_wait():
+    scheduler = Scheduler()
+    ran = threading.Event()
+    calls = []
+
+    def task():
+        calls.append(1)
+        if len(calls) == 2:
+            ran.set()
+
+    scheduler.add("task", task, 60)
+    threading.Thread(target=scheduler.run, daemon=True).start()
+    threading.Timer(0.1, scheduler.wake, args=["task"]).start()
+    assert ran.wait(5)
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from gw2rpc.api import GW2Api, pool_stats
+
+pytestmark = pytest.mark.usefixtures("fresh_api_state")
+
+
+def test_keys_share_kept_alive_connections(stub_server):
+    server = stub_server(lambda method, path, headers, body: (200, {}, '{"permissions": []}'))
+    clients = [GW2Api(f"key-{i}", base_url=server.url, verify=False) for i in range(5)]
+    for _ in range(4):
+        for client in clients:
+            client._call_api("tokeninfo", key=client._key)
+    assert server.count() == 20
+    assert server.connections == 1
+    assert GW2Api.pool_stats() == (19, 1)
+
+
+def test_concurrent_requests_stay_within_the_pool(stub_server):
+    server = stub_server(lambda method, path, headers, body: (200, {}, "{}"))
+    client = GW2Api(base_url=server.url)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for _ in range(5):
+            list(executor.map(client.get_map_info, range(8)))
+    assert server.count() == 40
+    assert server.connections <= 8
+    hits, misses = pool_stats(GW2Api.session)
+    assert hits + misses == 40 and misses == server.connections
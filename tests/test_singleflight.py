@@ -0,0 +1,62 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from gw2rpc.api import APIError, GW2Api
+
+CALLERS = 100
+
+pytestmark = pytest.mark.usefixtures("fresh_api_state")
+
+
+def fire(fn):
+    """
+    Calls fn from CALLERS threads at once, returns the results and exceptions
+    """
+    barrier = threading.Barrier(CALLERS)
+
+    def call():
+        barrier.wait()
+        try:
+            return fn()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        return list(executor.map(lambda _: call(), range(CALLERS)))
+
+
+def test_concurrent_identical_lookups_make_one_upstream_call(stub_server):
+    def respond(method, path, headers, body):
+        # Long enough for every caller to arrive while the first request is in flight
+        time.sleep(0.5)
+        return 200, {"Content-Type": "application/json"}, '{"id": 15, "name": "Queensdale"}'
+
+    server = stub_server(respond)
+    api = GW2Api(base_url=server.url)
+    results = fire(lambda: api.get_map_info(15))
+    assert server.count("/maps/15") == 1
+    assert all(r == {"id": 15, "name": "Queensdale"} for r in results)
+    assert GW2Api.flights.shared == CALLERS - 1
+
+
+def test_concurrent_callers_share_the_error(stub_server):
+    def respond(method, path, headers, body):
+        time.sleep(0.5)
+        return 404, {}, '{"text": "no such id"}'
+
+    server = stub_server(respond)
+    api = GW2Api(base_url=server.url)
+    results = fire(lambda: api.get_map_info(99999))
+    assert server.count("/maps/") == 1
+    assert all(isinstance(r, APIError) and r.code == 404 for r in results)
+
+
+def test_different_endpoints_are_not_coalesced(stub_server):
+    server = stub_server(lambda method, path, headers, body: (200, {}, "{}"))
+    api = GW2Api(base_url=server.url)
+    for map_id in range(3):
+        api.get_map_info(map_id)
+    assert server.count("/maps/") == 3
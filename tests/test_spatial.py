@@ -0,0 +1,47 @@
+import random
+
+from gw2rpc.spatial import PointIndex
+
+
+def linear_nearest(points_of_interest, x, y):
+    # The linear scan PointIndex replaced
+    closest, distance = None, float("inf")
+    for poi in points_of_interest.values():
+        if "name" not in poi:
+            continue
+        d = (poi["coord"][0] - x)**2 + (poi["coord"][1] - y)**2
+        if d < distance:
+            closest, distance = poi, d
+    return closest, distance
+
+
+def random_pois(n, seed=1):
+    rnd = random.Random(seed)
+    pois = {}
+    for i in range(n):
+        poi = {"id": i, "coord": [rnd.uniform(0, 81920), rnd.uniform(0, 114688)]}
+        # Unnamed points like unexplored vistas are skipped
+        if i % 10:
+            poi["name"] = f"Point {i}"
+        pois[str(i)] = poi
+    return pois
+
+
+def test_matches_linear_scan_on_a_continent_sized_set():
+    pois = random_pois(5000)
+    index = PointIndex(pois)
+    assert index.size == 4500
+    rnd = random.Random(2)
+    for _ in range(500):
+        x, y = rnd.uniform(-1000, 83000), rnd.uniform(-1000, 116000)
+        _, distance = linear_nearest(pois, x, y)
+        found = index.nearest(x, y)
+        # Ties may pick either point
+        assert (found["coord"][0] - x)**2 + (found["coord"][1] - y)**2 == distance
+        assert "name" in found
+
+
+def test_empty_and_unnamed_sets():
+    assert PointIndex({}).nearest(0, 0) is None
+    assert PointIndex({"1": {"coord": [1, 1]}}).nearest(0, 0) is None
+    assert PointIndex({"1": {"coord": [5, 5], "name": "Only"}}).nearest(100, 100)["name"] == "Only"
@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+
+import pytest
+
+from gw2rpc.api import MultiApi
+
+DELAY = 0.3
+
+
+def accounts(slow_key=None, slow_delay=0):
+    def respond(method, path, headers, body):
+        key = headers.get("Authorization", "").replace("Bearer ", "")
+        time.sleep(slow_delay if key == slow_key else DELAY)
+        path = path.split("?")[0]
+        if path == "/tokeninfo":
+            return 200, {}, json.dumps({"permissions": ["account", "characters", "builds"]})
+        if path == "/account":
+            return 200, {}, json.dumps({"name": "Account " + key, "world": 1001})
+        if path == "/worlds/1001":
+            return 200, {}, '{"name": "Anvil Rock"}'
+        return 200, {}, "[]"
+    return respond
+
+
+pytestmark = pytest.mark.usefixtures("api_workdir")
+
+
+def test_keys_are_verified_concurrently(stub_server):
+    server = stub_server(accounts())
+    keys = [f"key{i}" for i in range(5)]
+    start = time.monotonic()
+    api = MultiApi(keys, base_url=server.url)
+    elapsed = time.monotonic() - start
+    # Three round trips per key, serially that would be 15
+    assert elapsed < 6 * DELAY
+    assert [c.account for c in api._clients] == ["Account " + k for k in keys]
+    assert api.account == "Account key0" and api.world == "Anvil Rock"
+
+
+def test_slow_keys_are_added_after_the_deadline(stub_server):
+    server = stub_server(accounts(slow_key="slow", slow_delay=1))
+    start = time.monotonic()
+    api = MultiApi(["fast", "slow"], base_url=server.url, deadline=1.5)
+    assert time.monotonic() - start < 2
+    assert [c.account for c in api._clients] == ["Account fast"]
+    deadline = time.monotonic() + 5
+    while len(api._clients) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert [c.account for c in api._clients] == ["Account fast", "Account slow"]
+
+
+def test_clients_added_from_many_threads_are_all_kept():
+    class Client:
+        _authenticated = True
+        world = "Anvil Rock"
+
+        def __init__(self, account):
+            self.account = account
+
+        def get_character_names(self):
+            return []
+
+    class SlowList(list):
+        # Widens the gap between reading the client list and replacing it
+        def __add__(self, other):
+            copy = SlowList(self)
+            time.sleep(0.001)
+            copy.extend(other)
+            return copy
+
+    api = MultiApi([])
+    api._clients = SlowList()
+    threads = [threading.Thread(target=lambda t=t: [api._add_client(Client(f"{t}-{i}")) for i in range(20)])
+               for t in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(api._clients) == 160
+    assert api.account and api.world == "Anvil Rock"
@@ -0,0 +1,109 @@
+import json
+import threading
+import time
+
+import pytest
+
+from gw2rpc.webhook import WebhookDispatcher, redact
+
+PAYLOAD = {"username": "GW2RPC", "embeds": [{"title": "Some Char tagged up in Queensdale"}]}
+
+
+class Endpoints:
+    """
+    Answers webhook posts by the last path segment, counting attempts per url
+    """
+    def __init__(self):
+        self.attempts = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, method, path, headers, body):
+        assert json.loads(body) == PAYLOAD
+        with self.lock:
+            n = self.attempts[path] = self.attempts.get(path, 0) + 1
+        kind = path.rsplit("/", 1)[-1]
+        if kind == "slow":
+            time.sleep(0.5)
+        if kind == "limited" and n == 1:
+            return 429, {"Content-Type": "application/json"}, '{"retry_after": 0.25}'
+        if kind == "hostile" and n == 1:
+            return 429, {"Content-Type": "application/json"}, '{"retry_after": 3600}'
+        if kind == "flaky" and n < 3:
+            return 500, {}, ""
+        if kind == "gone":
+            return 404, {}, '{"message": "Unknown Webhook"}'
+        if kind == "down":
+            return 503, {}, ""
+        return 204, {}, ""
+
+
+@pytest.fixture
+def dispatcher(tmp_path):
+    d = WebhookDispatcher(dead_letter=str(tmp_path / "failed.log"))
+    d.sleeps = []
+    d._sleep = d.sleeps.append
+    yield d
+    d.executor.shutdown()
+
+
+def urls(server, *kinds):
+    return [f"{server.url}api/webhooks/{i}/{kind}" for i, kind in enumerate(kinds)]
+
+
+def test_fan_out_is_parallel(dispatcher, stub_server):
+    server = stub_server(Endpoints())
+    start = time.monotonic()
+    futures = dispatcher.send(urls(server, "slow", "slow", "slow", "slow"), PAYLOAD)
+    assert time.monotonic() - start < 0.1
+    assert all(f.result() for f in futures)
+    # Four half second posts on four workers
+    assert time.monotonic() - start < 1.5
+    assert dispatcher.delivered == 4
+
+
+def test_rate_limit_waits_for_retry_after(dispatcher, stub_server):
+    endpoints = Endpoints()
+    server = stub_server(endpoints)
+    assert dispatcher.send(urls(server, "limited"), PAYLOAD)[0].result()
+    assert dispatcher.sleeps == [0.25]
+    assert endpoints.attempts == {"/api/webhooks/0/limited": 2}
+
+
+def test_retry_after_is_capped(dispatcher, stub_server):
+    endpoints = Endpoints()
+    server = stub_server(endpoints)
+    assert dispatcher.send(urls(server, "hostile"), PAYLOAD)[0].result()
+    assert dispatcher.sleeps == [30]
+
+
+def test_server_errors_are_retried(dispatcher, stub_server):
+    endpoints = Endpoints()
+    server = stub_server(endpoints)
+    assert dispatcher.send(urls(server, "flaky"), PAYLOAD)[0].result()
+    assert endpoints.attempts == {"/api/webhooks/0/flaky": 3}
+
+
+def test_failures_go_to_the_dead_letter_log(dispatcher, stub_server, tmp_path):
+    endpoints = Endpoints()
+    server = stub_server(endpoints)
+    futures = dispatcher.send(urls(server, "gone", "down", "ok"), PAYLOAD)
+    assert [f.result() for f in futures] == [False, False, True]
+    # Client errors are not retried, server errors until the retries ran out
+    assert endpoints.attempts["/api/webhooks/0/gone"] == 1
+    assert endpoints.attempts["/api/webhooks/1/down"] == dispatcher.retries + 1
+    entries = [json.loads(line) for line in (tmp_path / "failed.log").read_text().splitlines()]
+    assert sorted(e["error"] for e in entries) == ["HTTP 404", "HTTP 503"]
+    assert all(e["data"] == PAYLOAD and e["url"].endswith("/***") for e in entries)
+    assert dispatcher.failed == 2
+
+
+def test_connection_errors_are_dead_lettered(dispatcher, tmp_path):
+    # Nothing listens on port 9 of localhost
+    assert not dispatcher.send(["http://127.0.0.1:9/api/webhooks/1/token"], PAYLOAD)[0].result()
+    entry = json.loads((tmp_path / "failed.log").read_text())
+    assert entry["error"] == "ConnectionError"
+    assert len(dispatcher.sleeps) == dispatcher.retries
+
+
+def test_token_is_redacted():
+    assert redact("https://discord.com/api/webhooks/123/secret") == "https://discord.com/api/webhooks/123/***"